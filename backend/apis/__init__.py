@@ -1,19 +1,16 @@
 import re
-from glob import glob
 
 from .common import *
+from .openapi import bp as openapi_bp
+from .v1.auth import bp as auth_v1_bp
+from .v1.system import bp as system_v1_bp
 
-for name in glob(os.path.dirname(__file__) + '/*/*.??'):
-    if os.path.isfile(name) and not name.endswith('__.py'):
-        tmp = name.split(os.sep)
-        api = tmp[-3]
-        version = tmp[-2]
-        name = tmp[-1][:-3]
-        expression = f'from {api}.{version}.{name} import bp as {name}_{version}_bp'
-        exec(expression)
-
-# Blueprints用于在创建app时动态注册蓝图
-Blueprints = [module for name, module in globals().items() if name.endswith('_bp') and isinstance(module, Blueprint)]
+# Blueprints用于在创建app时注册蓝图：新增接口模块后需要在上面导入并添加到这里
+Blueprints = [
+    auth_v1_bp,
+    system_v1_bp,
+    openapi_bp,
+]
 
 # 无需进行鉴权的接口的正则表达式
-SKIP_AUTH_REGEX = re.compile(r'^/apis/v1/auth')
+SKIP_AUTH_REGEX = re.compile(r'^/(apis/v1/auth|openapi\.json$)')
@@ -5,8 +5,12 @@ Author      : jinming.yang
 Description : API接口会共用到的一些类、方法的定义实现
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 """
+import hashlib
+import ipaddress
 import json
+import math
 from datetime import datetime
+from datetime import timedelta
 from functools import partial
 from functools import wraps
 from time import time
@@ -15,8 +19,9 @@ from typing import Iterable
 from typing import Union
 from uuid import uuid4
 
-from clickhouse_driver import Client
 from flask import Blueprint
+from flask import g
+from flask import has_request_context
 from flask import make_response
 from flask import request
 from sqlalchemy import Column
@@ -27,10 +32,12 @@ from sqlalchemy import or_
 from sqlalchemy import select
 from sqlalchemy import text
 from sqlalchemy import update
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 
-from config import DATABASE_OLAP_URI
+from config import OLAP_DEFAULT_WINDOW_DAYS
+from config import OLAP_MAX_WINDOW
 from defines import *
 from utils import *
 
@@ -107,6 +114,105 @@ class ParamSchema:
             return type(value) is type and issubclass(value, ParamSchema)
 
 
+class DataLoader:
+    """
+    请求内按ID批量加载关联实体，避免逐行查询或者查询整张表
+    格式化数据时通过load登记ID并得到占位值，首次取值（序列化响应）时把已登记的ID合并成一次IN查询，
+    加载结果在当前请求内缓存
+    """
+
+    def __init__(self, model, column=None):
+        self.model = model
+        self.column = model.id if column is None else column
+        self._cache = {}  # {ID: 记录}，不存在的ID对应None
+        self._pending = set()
+
+    @classmethod
+    def of(cls, model, column=None) -> 'DataLoader':
+        """
+        获取当前请求中model对应的加载器，同一请求内共用（不在请求中时每次新建）
+        Args:
+            model: 要加载的model
+            column: 作为ID的列，默认为model.id
+
+        Returns:
+            DataLoader
+        """
+        if not has_request_context():
+            return cls(model, column)
+        loaders = g.setdefault('data_loaders', {})
+        key = (model, None if column is None else column.key)
+        if (loader := loaders.get(key)) is None:
+            loader = loaders[key] = cls(model, column)
+        return loader
+
+    def load(self, key, field: str = None, default=None) -> 'LoaderValue':
+        """
+        登记要加载的ID
+        Args:
+            key: ID
+            field: 取值时返回记录的该字段，默认返回记录本身
+            default: 记录不存在时返回的值
+
+        Returns:
+            占位值，响应序列化时自动取值，也可以调用get取值
+        """
+        if key is not None and key not in self._cache:
+            self._pending.add(key)
+        return LoaderValue(self, key, field, default)
+
+    def prime(self, items: Iterable):
+        """
+        缓存已经查询到的记录，之后不再重复查询
+        """
+        for item in items:
+            self._cache[getattr(item, self.column.key)] = item
+
+    def dispatch(self):
+        """
+        用一次查询加载所有已登记且未缓存的ID
+        """
+        if not self._pending:
+            return
+        keys, self._pending = self._pending, set()
+        sql = select(self.model).where(self.column.in_(keys))
+        for item in execute_sql(sql, many=True, scalar=True, record=True, raise_error=True):
+            self._cache[getattr(item, self.column.key)] = item
+        for key in keys:
+            self._cache.setdefault(key, None)
+
+    def get(self, key):
+        """
+        获取ID对应的记录（同时加载其他已登记的ID）
+        Returns:
+            记录，不存在时返回None
+        """
+        if key is None:
+            return None
+        if key not in self._cache:
+            self._pending.add(key)
+            self.dispatch()
+        return self._cache[key]
+
+
+class LoaderValue:
+    """
+    DataLoader.load返回的占位值
+    """
+    __slots__ = ('loader', 'key', 'field', 'default')
+
+    def __init__(self, loader: DataLoader, key, field: str = None, default=None):
+        self.loader = loader
+        self.key = key
+        self.field = field
+        self.default = default
+
+    def get(self):
+        if (item := self.loader.get(self.key)) is None:
+            return self.default
+        return getattr(item, self.field, self.default) if self.field else item
+
+
 def get_blueprint(path, name):
     """
     生成API的蓝图：方便统一调整
@@ -158,13 +264,256 @@ def response(status: int, data=None, headers=None, msg=''):
     return resp
 
 
+def _get_params():
+    """
+    获取请求的参数
+        GET、DELETE： query参数
+        POST、PUT、PATCH： json参数
+    Returns:
+        dict
+    """
+    result = {}
+    # GET和DELETE按照规范是使用url参数
+    if request.method in ('GET', 'DELETE'):
+        for key in dict(request.args).keys():
+            # 兼容多个key的情况：例如?key=value1&key=value2
+            result[key] = request.args.getlist(key)
+    # 其他类型请求默认是JSON参数
+    else:
+        result = request.json
+    return result
+
+
+def _req_value(define, value):
+    """
+    设置请求参数的格式
+    Args:
+        define: 参数定义
+        value: 传入值
+
+    Returns:
+        类型转化后的参数
+    """
+    if define is Any:
+        # 参数可以是任意类型
+        return value
+    elif define is datetime:
+        # 时间类型
+        return datetime.strptime(value, Constants.DEFINE_DATE_FORMAT)
+    elif issubclass(define, ModelTemplate):
+        # model定义
+        return define(**value)
+    elif issubclass(define, Enum):
+        # 枚举类型既支持传name也支持传value
+        tmp = {x.name: x for x in list(define)}
+        if value in tmp:
+            # 按照枚举的Key去匹配
+            return tmp[value]
+        else:
+            # Key匹配不上则认为传递的是枚举Value
+            return define(value)
+    else:
+        # 其他类型
+        return define(value)
+
+
+def _resp_value(define: ParamDefine, value):
+    """
+    输出参数的校验及特殊类型的序列化
+    Args:
+        define: 参数定义
+        value: 传入值
+
+    Returns:
+        处理后的参数
+    """
+    if isinstance(value, LoaderValue):
+        value = value.get()
+    if value is None and hasattr(define, 'default'):
+        return define.default
+    return value
+
+
+def _req_params(define: Union[ParamDefine, ParamSchema], source, flag: bool):
+    """
+    根据定义生成请求参数
+    Args:
+        define: 参数定义
+        source: 传入参数
+        flag: 是否是GET或DELETE请求（影响参数获取方式）
+
+    Returns:
+        请求参数
+    """
+    # 判断传过来是的共用的Schema还是单独定义的dict
+    if ParamSchema.is_schema(define):
+        define = define.define
+    if not isinstance(source, dict):
+        raise APIErrorResponse(422, '参数类型不正确')
+    result = {}
+    assert isinstance(define.type, dict)
+    for field_name, field_define in define.type.items():
+        # 1. 每一个属性都需要通过ParamDefine进行定义声明
+        assert isinstance(field_define, ParamDefine)
+        # 2. 判断是否为必填参数
+        if field_define.required and field_name not in source:
+            raise APIErrorResponse(422, '缺少必填参数')
+        # 3. 判断非必填的参数是否存在
+        if field_name in source:
+            # 从这里开始需要对各种类型的参数进行处理
+            str_type = str(field_define.type)
+            # 3.1 List类型的嵌套
+            if str_type.startswith('typing.List'):
+                if isinstance(source[field_name], list):
+                    # 获取List中定义的子类型是什么
+                    inner_type = field_define.type.__args__[0]
+                    if isinstance(inner_type, ParamDefine):
+                        # List需要套一层ParamDefine的也就只有dict或ParamSchema，不然普通的类型直接放到List里面就行，所以这里需要按嵌套结构处理
+                        result[field_name] = [_req_params(inner_type, row, flag) for row in source[field_name]]
+                    else:
+                        # 通过偏函数partial将inner_type作为_req_value的第一个参数生成一个新的只需要value参数的函数，使用map高阶函数遍历
+                        result[field_name] = list(map(partial(_req_value, inner_type), source[field_name]))
+                else:
+                    # 如果入参不是数组则提示参数错误
+                    raise APIErrorResponse(422, '参数类型错误')
+            # 3.2 Dict意味着允许传递对象类型的参数，但是具体有哪些key未作限定
+            elif str_type.startswith('typing.Dict'):
+                # TODO： 这里面再嵌套ParamDefine可能需要再完善，但是需要typing.Dict的基本都是动态定义，应该情况极少
+                assert isinstance(source[field_name], dict)
+                key_type = field_define.type.__args__[0]
+                value_type = field_define.type.__args__[1]
+                result[field_name] = {
+                    _req_value(key_type, k): _req_value(value_type, v)
+                    for k, v in source[field_name].items()
+                }
+            # 3.3 嵌套结构
+            elif isinstance(field_define.type, dict):
+                result[field_name] = _req_params(field_define, source[field_name], flag)
+            # 3.4 其他常规情况
+            else:
+                # Get、Delete获取的都是list
+                if flag and len(source[field_name]) == 1:
+                    # 能到这步定义肯定就不是要的list了，所以直接取出第一个即可
+                    result[field_name] = _req_value(field_define.type, source[field_name][0])
+                else:
+                    result[field_name] = _req_value(field_define.type, source[field_name])
+            # 4. 如果提供了校验函数则校验数据取值
+            if hasattr(field_define, 'valid'):
+                try:
+                    if isinstance(result[field_name], (list, dict)):
+                        # 如果是可遍历的类型则遍历校验所有子项都满足参数要求
+                        assert all(map(field_define.valid, result[field_name]))
+                    else:
+                        assert field_define.valid(result[field_name])
+                except:
+                    if hasattr(field_define, 'resp'):
+                        # 参数定义的时候定义了校验不通过的响应则优先使用定义的（主要是满足不同的参数校验需要给出不同提示的场景）
+                        raise APIErrorResponse(field_define.resp)
+                    else:
+                        # 没有提供特定的响应则使用默认的
+                        raise APIErrorResponse(422, '参数范围错误')
+        else:
+            # 3.1 没传参数则看看有没有默认值
+            if hasattr(field_define, 'default'):
+                result[field_name] = field_define.default
+                continue
+    return result
+
+
+def _resp_params(define: Union[ParamDefine, ParamSchema], source):
+    """
+    根据参数定义生成响应参数
+    Args:
+        define: 参数定义
+        source: 接口输出
+        language: 语言类型
+
+    Returns:
+        响应参数
+    """
+    if ParamSchema.is_schema(define):
+        define = define.define
+    if define.type is None:
+        # 接口不需要响应数据
+        return None
+    if define.type is Any:
+        return source
+    # 1 嵌套结构
+    if isinstance(define.type, dict):
+        result = {}
+        for field_name, field_define in define.type.items():
+            tmp = None
+            if ParamSchema.is_schema(field_define):
+                field_define = field_define.define
+            if isinstance(source, (Row, ModelTemplate, ModelRecord)):
+                # 如果是查询数据库获得的实例对象则递归处理
+                if field_define.required or hasattr(source, field_define.key or field_name):
+                    tmp = _resp_params(field_define, getattr(source, field_define.key or field_name))
+            elif isinstance(source, dict):
+                # 也是递归，但dict类型是.get，上面是getattr
+                if field_define.required or (field_define.key or field_name in source):
+                    tmp = _resp_params(field_define, source[field_define.key or field_name])
+            if field_define.required or tmp:
+                # 必填参数或者可选参数也有数据则进行赋值
+                result[field_name] = tmp
+        return result
+    # 2 List类型的嵌套
+    elif str(define.type).startswith('typing.List'):
+        if isinstance(source, Iterable):
+            inner_type = define.type.__args__[0]
+            # 这里为什么分开处理见_req_params的List嵌套的处理注释
+            if isinstance(inner_type, ParamDefine):
+                return [_resp_params(inner_type, row) for row in source]
+            else:
+                return list(map(partial(_resp_value, define), source))
+        else:
+            logger.debug('data is not a list: {}', type(source).__name__)
+            return []
+    # 3 其他常规情况
+    else:
+        return _resp_value(define, source)
+
+
+def _coalesce_key(endpoint: str, scope, view_args: dict, params: dict) -> str:
+    """
+    生成请求合并的key
+    Args:
+        endpoint: 接口
+        scope: 权限范围
+        view_args: 路径参数
+        params: 校验后的请求参数
+
+    Returns:
+        key
+    """
+    value = json.dumps([view_args, params], sort_keys=True, cls=JSONExtensionEncoder)
+    return f'{endpoint}:{scope}:{hashlib.sha1(value.encode()).hexdigest()}'
+
+
+def _coalesce_call(function, args, kwargs, response_param, response_status):
+    """
+    执行接口并序列化响应内容，以便共享给合并的请求
+    Returns:
+        (状态码, 响应内容)
+    """
+    resp = function(*args, **kwargs)
+    if not response_param:
+        return 204, None
+    data = _resp_params(response_param, resp)
+    if isinstance(data, (list, dict)):
+        data = json.dumps(data, cls=JSONExtensionEncoder)
+    return response_status, data
+
+
 def api_wrapper(
         request_header: Union[ParamDefine, ParamSchema] = None,
         request_param: Union[ParamDefine, ParamSchema] = None,
         response_param: Union[ParamDefine, ParamSchema] = None,
         response_header: Union[ParamDefine, ParamSchema] = None,
         response_status: int = 200,
-        permission: set = None
+        permission: set = None,
+        read_your_writes: bool = False,
+        coalesce: bool = False
 ):
     """
     装饰器：统一处理API响应异常以及必要参数的校验
@@ -175,214 +524,13 @@ def api_wrapper(
         response_header: 响应头，用于生成接口文档
         response_status: 成功响应的状态码，默认是200
         permission: 接口权限
+        read_your_writes: 读写一致，开启后接口内发生写操作，后续的查询都走主库而不是只读副本
+        coalesce: 合并并发的相同请求（接口、参数及权限范围都相同），只执行一次并共享响应内容，只用于查询接口
 
     Returns:
         无异常则返回方法的返回值，异常返回Error
     """
 
-    def _get_params():
-        """
-        获取请求的参数
-            GET、DELETE： query参数
-            POST、PUT、PATCH： json参数
-        Returns:
-            dict
-        """
-        result = {}
-        # GET和DELETE按照规范是使用url参数
-        if request.method in ('GET', 'DELETE'):
-            for key in dict(request.args).keys():
-                # 兼容多个key的情况：例如?key=value1&key=value2
-                result[key] = request.args.getlist(key)
-        # 其他类型请求默认是JSON参数
-        else:
-            result = request.json
-        return result
-
-    def _req_value(define, value):
-        """
-        设置请求参数的格式
-        Args:
-            define: 参数定义
-            value: 传入值
-
-        Returns:
-            类型转化后的参数
-        """
-        if define is Any:
-            # 参数可以是任意类型
-            return value
-        elif define is datetime:
-            # 时间类型
-            return datetime.strptime(value, Constants.DEFINE_DATE_FORMAT)
-        elif issubclass(define, ModelTemplate):
-            # model定义
-            return define(**value)
-        elif issubclass(define, Enum):
-            # 枚举类型既支持传name也支持传value
-            tmp = {x.name: x for x in list(define)}
-            if value in tmp:
-                # 按照枚举的Key去匹配
-                return tmp[value]
-            else:
-                # Key匹配不上则认为传递的是枚举Value
-                return define(value)
-        else:
-            # 其他类型
-            return define(value)
-
-    def _resp_value(define: ParamDefine, value):
-        """
-        输出参数的校验及特殊类型的序列化
-        Args:
-            define: 参数定义
-            value: 传入值
-
-        Returns:
-            处理后的参数
-        """
-        if value is None and hasattr(define, 'default'):
-            return define.default
-        return value
-
-    def _req_params(define: Union[ParamDefine, ParamSchema], source, flag: bool):
-        """
-        根据定义生成请求参数
-        Args:
-            define: 参数定义
-            source: 传入参数
-            flag: 是否是GET或DELETE请求（影响参数获取方式）
-
-        Returns:
-            请求参数
-        """
-        # 判断传过来是的共用的Schema还是单独定义的dict
-        if ParamSchema.is_schema(define):
-            define = define.define
-        if not isinstance(source, dict):
-            raise APIErrorResponse(422, '参数类型不正确')
-        result = {}
-        assert isinstance(define.type, dict)
-        for field_name, field_define in define.type.items():
-            # 1. 每一个属性都需要通过ParamDefine进行定义声明
-            assert isinstance(field_define, ParamDefine)
-            # 2. 判断是否为必填参数
-            if field_define.required and field_name not in source:
-                raise APIErrorResponse(422, '缺少必填参数')
-            # 3. 判断非必填的参数是否存在
-            if field_name in source:
-                # 从这里开始需要对各种类型的参数进行处理
-                str_type = str(field_define.type)
-                # 3.1 List类型的嵌套
-                if str_type.startswith('typing.List'):
-                    if isinstance(source[field_name], list):
-                        # 获取List中定义的子类型是什么
-                        inner_type = field_define.type.__args__[0]
-                        if isinstance(inner_type, ParamDefine):
-                            # List需要套一层ParamDefine的也就只有dict或ParamSchema，不然普通的类型直接放到List里面就行，所以这里需要按嵌套结构处理
-                            result = [_req_params(inner_type.type, row, flag) for row in source[field_name]]
-                        else:
-                            # 通过偏函数partial将inner_type作为_req_value的第一个参数生成一个新的只需要value参数的函数，使用map高阶函数遍历
-                            result[field_name] = list(map(partial(_req_value, inner_type), source[field_name]))
-                    else:
-                        # 如果入参不是数组则提示参数错误
-                        raise APIErrorResponse(422, '参数类型错误')
-                # 3.2 Dict意味着允许传递对象类型的参数，但是具体有哪些key未作限定
-                elif str_type.startswith('typing.Dict'):
-                    # TODO： 这里面再嵌套ParamDefine可能需要再完善，但是需要typing.Dict的基本都是动态定义，应该情况极少
-                    assert isinstance(source[field_name], dict)
-                    key_type = field_define.__args__[0]
-                    value_type = field_define.__args__[1]
-                    result[field_name] = {
-                        _req_value(key_type, k): _req_value(value_type, v)
-                        for k, v in source[field_name].items()
-                    }
-                # 3.3 嵌套结构
-                elif isinstance(field_define.type, dict):
-                    result[field_name] = _req_params(field_define, source[field_name], flag)
-                # 3.4 其他常规情况
-                else:
-                    # Get、Delete获取的都是list
-                    if flag and len(source[field_name]) == 1:
-                        # 能到这步定义肯定就不是要的list了，所以直接取出第一个即可
-                        result[field_name] = _req_value(field_define.type, source[field_name][0])
-                    else:
-                        result[field_name] = _req_value(field_define.type, source[field_name])
-                # 4. 如果提供了校验函数则校验数据取值
-                if hasattr(field_define, 'valid'):
-                    try:
-                        if isinstance(result[field_name], (list, dict)):
-                            # 如果是可遍历的类型则遍历校验所有子项都满足参数要求
-                            assert all(map(field_define.valid, result[field_name]))
-                        else:
-                            assert field_define.valid(result[field_name])
-                    except:
-                        if hasattr(field_define, 'resp'):
-                            # 参数定义的时候定义了校验不通过的响应则优先使用定义的（主要是满足不同的参数校验需要给出不同提示的场景）
-                            raise APIErrorResponse(field_define.resp)
-                        else:
-                            # 没有提供特定的响应则使用默认的
-                            raise APIErrorResponse(422, '参数范围错误')
-            else:
-                # 3.1 没传参数则看看有没有默认值
-                if hasattr(field_define, 'default'):
-                    result[field_name] = field_define.default
-                    continue
-        return result
-
-    def _resp_params(define: Union[ParamDefine, ParamSchema], source):
-        """
-        根据参数定义生成响应参数
-        Args:
-            define: 参数定义
-            source: 接口输出
-            language: 语言类型
-
-        Returns:
-            响应参数
-        """
-        if ParamSchema.is_schema(define):
-            define = define.define
-        if define.type is None:
-            # 接口不需要响应数据
-            return None
-        if define.type is Any:
-            return source
-        # 1 嵌套结构
-        if isinstance(define.type, dict):
-            result = {}
-            for field_name, field_define in define.type.items():
-                tmp = None
-                if ParamSchema.is_schema(field_define):
-                    field_define = field_define.define
-                if isinstance(source, (Row, ModelTemplate)):
-                    # 如果是查询数据库获得的实例对象则递归处理
-                    if field_define.required or hasattr(source, field_define.key or field_name):
-                        tmp = _resp_params(field_define, getattr(source, field_define.key or field_name))
-                elif isinstance(source, dict):
-                    # 也是递归，但dict类型是.get，上面是getattr
-                    if field_define.required or (field_define.key or field_name in source):
-                        tmp = _resp_params(field_define, source[field_define.key or field_name])
-                if field_define.required or tmp:
-                    # 必填参数或者可选参数也有数据则进行赋值
-                    result[field_name] = tmp
-            return result
-        # 2 List类型的嵌套
-        elif str(define.type).startswith('typing.List'):
-            if isinstance(source, Iterable):
-                inner_type = define.type.__args__[0]
-                # 这里为什么分开处理见_req_params的List嵌套的处理注释
-                if isinstance(inner_type, ParamDefine):
-                    return [_resp_params(inner_type, row) for row in source]
-                else:
-                    return list(map(partial(_resp_value, define), source))
-            else:
-                logger.debug(source, 'data is not a list')
-                return []
-        # 3 其他常规情况
-        else:
-            return _resp_value(define, source)
-
     def decorator(function):
         function.__apispec__ = {
             'request_param': request_param,
@@ -395,7 +543,8 @@ def api_wrapper(
         @wraps(function)
         def wrapper(*args, **kwargs):
             kwargs['oltp_session'] = oltp_session_factory()
-            kwargs['olap_session'] = Client.from_url(DATABASE_OLAP_URI)
+            kwargs['olap_session'] = OLAPClients.lazy()  # 首次查询OLAP时才获取客户端
+            rw_tokens = set_read_your_writes(read_your_writes)
             try:
                 # 1. 接口的鉴权处理：获取登陆的user
                 if request.uid:
@@ -412,11 +561,21 @@ def api_wrapper(
                 # 2. 请求参数获取
                 if request_param:
                     # 定义的请求参数要求
-                    kwargs.update(_req_params(request_param, _get_params(), request.method in ('GET', 'DELETE')))
+                    params = _req_params(request_param, _get_params(), request.method in ('GET', 'DELETE'))
+                    kwargs.update(params)
+                else:
+                    params = {}
                 # 3. 请求头信息获取
                 if request_header:
                     kwargs.update(_req_params(request_header, {k: v for k, v in request.headers.items()}, False))
                 # 4. API接口调用
+                if coalesce:
+                    # 有权限要求的接口结果只取决于角色，其他接口按用户区分
+                    scope = user.role.name if permission else request.uid
+                    key = _coalesce_key(request.endpoint, scope, request.view_args, params)
+                    call = partial(_coalesce_call, function, args, kwargs, response_param, response_status)
+                    status, data = SingleFlight().do(request.endpoint, key, call)
+                    return response(status, data, headers=response_header)
                 resp = function(*args, **kwargs)
                 # 5. 接口响应数据处理
                 if response_param:
@@ -440,13 +599,22 @@ def api_wrapper(
                 kwargs['oltp_session'].rollback()
                 logger.debug(ex)
                 return response(422, headers=response_header, msg='参数类型错误')
+            except TimeoutError as ex:
+                kwargs['oltp_session'].rollback()
+                logger.warning(ex)
+                return response(503, headers=response_header, msg='服务繁忙，请稍后重试')
             except Exception as ex:
                 kwargs['oltp_session'].rollback()
                 logger.exception(ex)
                 return response(500, headers=response_header, msg='服务端响应失败')
             finally:
-                kwargs['olap_session'].disconnect()
-                kwargs['oltp_session'].commit()
+                kwargs['olap_session'].release()
+                reset_read_your_writes(rw_tokens)
+                try:
+                    kwargs['oltp_session'].commit()
+                finally:
+                    # scoped_session是线程绑定的，请求结束必须remove，释放identity map并将连接归还连接池
+                    oltp_session_factory.remove()
 
         return wrapper
 
@@ -465,7 +633,7 @@ def orm_create(cls, params: dict, repeat_msg='关键字重复'):
         新增数据的ID
     """
     params['updated_at'] = datetime.now()
-    _params = {k: v for k, v in params.items() if k in cls.get_columns()}
+    _params = {k: v for k, v in params.items() if k in cls.column_plan().column_set}
     result, flag = execute_sql(insert(cls).values(**_params))
     if flag:
         return result
@@ -491,7 +659,7 @@ def orm_update(cls, resource_id: str, params: dict, error_msg='无效输入'):
     if not params:
         raise APIErrorResponse(422, '缺少必填参数')
     params['updated_at'] = datetime.now()
-    _params = {k: v for k, v in params.items() if k in cls.get_columns()}
+    _params = {k: v for k, v in params.items() if k in cls.column_plan().column_set}
     result, flag = execute_sql(update(cls).where(cls.id == resource_id).values(**_params))
     if flag and not result:
         raise APIErrorResponse(404, '未找到对应资源')
@@ -525,7 +693,114 @@ def orm_delete(cls, resource_id: Union[str, list, set]):
         session.commit()
 
 
-def paginate_query(sql, params, scalar=False, format_func=None, session=None):
+def _add_sort(sql, params):
+    """
+    根据请求参数中的sort添加排序条件
+    Args:
+        sql: 查询SQL
+        params: 请求参数，对应接口的kwargs
+
+    Returns:
+        添加排序后的SQL对象
+    """
+    for column in params.get('sort', []):
+        if column == '':
+            continue
+        if column[0] in ('+', '-'):
+            direct = 'DESC' if column[0] == '-' else 'ASC'
+            column = column[1:]
+        else:
+            direct = 'ASC'
+        sql = sql.order_by(text(f'{column} {direct}'))
+    return sql
+
+
+# 表名之后的OLAP子句的顺序
+_OLAP_CLAUSES = ('SAMPLE', 'PREWHERE')
+
+
+def olap_hint(sql, clause: str):
+    """
+    在查询的表名之后添加OLAP（ClickHouse）子句，多个子句按SAMPLE、PREWHERE的顺序输出
+    Args:
+        sql: SQL对象
+        clause: 子句，例如：SAMPLE 0.1
+
+    Returns:
+        添加子句后的SQL对象
+    """
+    table = sql.froms[0]
+    clauses = [item for item in sql._hints.get((table, '*'), '').split('\n') if item]
+    clauses.append(clause)
+    clauses.sort(key=lambda x: _OLAP_CLAUSES.index(x.split(' ', 1)[0]))
+    # 非OLAP的方言会忽略该hint
+    return sql.with_hint(table, '\n'.join(clauses))
+
+
+def time_window(sql, params: dict, column: Column, role=None, field_name=None):
+    """
+    添加OLAP列表查询的时间范围：未指定开始时间时默认从OLAP_DEFAULT_WINDOW_DAYS个自然日前的0点开始查询
+    （默认为当天0点，按天分区的表只读取一个分区；滚动的24小时几乎总会跨两个分区），
+    超过角色允许的最大范围时报错，条件以PREWHERE添加在时间列（分区键）上，只读取范围内的分区
+    Args:
+        sql: SQL对象
+        params: 接口参数，时间范围为{field_name}_start、{field_name}_end
+        column: 时间列
+        role: 当前用户的角色
+        field_name: 条件名称(默认为空时和查询列同名)
+
+    Returns:
+        添加时间范围后的SQL对象
+    """
+    name = field_name or column.key
+    end = params.get(f'{name}_end')
+    if not (start := params.get(f'{name}_start')):
+        day = (end or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = day - timedelta(days=max(OLAP_DEFAULT_WINDOW_DAYS, 1) - 1)
+    if end and start > end:
+        raise APIErrorResponse(422, '开始时间不能晚于结束时间')
+    limit = OLAP_MAX_WINDOW.get(role.name if role else '*', OLAP_MAX_WINDOW.get('*'))
+    if limit and (end or datetime.now()) - start > timedelta(days=limit):
+        raise APIErrorResponse(422, f'查询时间范围不能超过{limit:g}天')
+    condition = column >= start if end is None else column.between(start, end)
+    return olap_hint(sql, f'PREWHERE {compile_olap(condition)}')
+
+
+def sample_condition(sql, params: dict, field_name='sample'):
+    """
+    添加OLAP查询的采样（SAMPLE）子句，表需要定义SAMPLE BY
+    Args:
+        sql: SQL对象
+        params: 接口参数
+        field_name: 采样比例的参数名称
+
+    Returns:
+        添加采样后的SQL对象
+    """
+    if rate := params.get(field_name):
+        if rate < 1:
+            sql = olap_hint(sql, f'SAMPLE {rate}')
+    return sql
+
+
+def sample_estimate(count: int, rate: float):
+    """
+    根据采样数据的数量估算全量数据的数量
+    Args:
+        count: 采样得到的数量
+        rate: 采样比例
+
+    Returns:
+        估算的数量, 采样信息（采样比例、置信度、误差范围）
+    """
+    if not rate or rate >= 1:
+        return count, None
+    # 按伯努利抽样估算：总数≈count/rate，标准差≈sqrt(count*(1-rate))/rate，取95%置信区间
+    error = 1.96 * math.sqrt(count * (1 - rate)) / rate
+    return round(count / rate), {'rate': rate, 'confidence': 0.95, 'error': round(error)}
+
+
+def paginate_query(sql, params, scalar=False, format_func=None, session=None, record=True):
     """
     统一分分页查询操作
     Args:
@@ -534,49 +809,97 @@ def paginate_query(sql, params, scalar=False, format_func=None, session=None):
         scalar:是否需要scalars
         format_func:直接返回查询后的数据，不进行响应，用于数据结构需要特殊处理的情况
         session: 特殊OLAP等情况需要方法自己提供session
+        record: scalar查询model时返回只读记录而不是ORM实例，列表接口只读，默认值为True
 
     Returns:
         {
             'total': int,
-            'data': List[Any]
+            'data': List[Any],
+            'sample': 采样信息（参数中指定了采样比例sample时）
         }
     """
-
-    def _add_sort(_sql):
-        for column in params.get('sort', []):
-            if column == '':
-                continue
-            if column[0] in ('+', '-'):
-                direct = 'DESC' if column[0] == '-' else 'ASC'
-                column = column[1:]
-            else:
-                direct = 'ASC'
-            _sql = _sql.order_by(text(f'{column} {direct}'))
-        return _sql
+    sql = sample_condition(sql, params)
 
     if params['size'] == 0:
         # 特殊约定的查询全量数据的方式，可以以其他方式，比如size是-1等
-        sql = _add_sort(sql)
-        data = execute_sql(sql, many=True, scalar=scalar, session=session)
-        result = {'total': len(data), 'data': data}
+        sql = _add_sort(sql, params)
+        data = execute_sql(sql, many=True, scalar=scalar, record=record, session=session)
+        total = len(data)
+        result = {'total': total, 'data': data}
     else:
-        total_sql = select(func.count()).select_from(sql)
-        total = execute_sql(total_sql, many=False, scalar=True, session=session)
         if params['size'] > 100 or params['size'] < 1:
             raise APIErrorResponse(422, '分页size取值范围错误，取值范围为1-100')
         if params['page'] < 1:
             raise APIErrorResponse(422, '分页page参数范围错误')
-        sql = sql.limit(params['size']).offset((params['page'] - 1) * params['size'])
-        result = {
-            'total': total,
-            'data': execute_sql(_add_sort(sql), many=True, scalar=scalar, session=session)
-        }
+        total_sql = select(func.count()).select_from(sql)
+        sql = _add_sort(sql.limit(params['size']).offset((params['page'] - 1) * params['size']), params)
+        options = {'many': True, 'scalar': scalar, 'record': record}
+        if session is None:
+            # 总数和分页数据各自使用连接并发查询，耗时取两者中较长的一个
+            total, data = execute_concurrently([(total_sql, {'scalar': True}), (sql, options)])
+        elif not isinstance(session, (Session, scoped_session)):
+            # OLAP客户端不能同时执行多个查询，分页数据使用客户端池中的另一个客户端
+            client = OLAPClients.acquire()
+            try:
+                total, data = execute_concurrently([
+                    (total_sql, {'scalar': True, 'session': session}),
+                    (sql, {**options, 'session': client}),
+                ])
+            finally:
+                OLAPClients.release(client)
+        else:
+            total = execute_sql(total_sql, many=False, scalar=True, session=session)
+            data = execute_sql(sql, session=session, **options)
+        result = {'total': total, 'data': data}
+    if params.get('sample'):
+        # 采样查询时总数为估算值
+        result['total'], result['sample'] = sample_estimate(total, params['sample'])
     if format_func:
         # 需要按照特定格式对数据进行修改的时候使用format_func
         result['data'] = list(map(format_func, result['data']))
     return result
 
 
+def contains_pattern(keyword: str) -> str:
+    """
+    生成包含关键字的LIKE/ILIKE匹配模式，关键字中的通配符按普通字符匹配，使用时需要指定escape='\\'
+    Args:
+        keyword: 关键字
+
+    Returns:
+        '%关键字%'
+    """
+    # PostgreSQL和ClickHouse的LIKE默认都以反斜杠转义
+    return '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def ip_bounds(value: str):
+    """
+    解析IPv4的查询条件
+    Args:
+        value: 单个IP（10.0.0.1）、CIDR（10.0.0.0/24）、范围（10.0.0.1-10.0.0.50）、前缀（10.0.、10.0.*）
+
+    Returns:
+        (起始IP, 结束IP)，格式错误时抛出ValueError
+    """
+    value = value.strip()
+    if '/' in value:
+        network = ipaddress.IPv4Network(value, strict=False)
+        return network.network_address, network.broadcast_address
+    if '-' in value:
+        start, end = (ipaddress.IPv4Address(item.strip()) for item in value.split('-', 1))
+        if start > end:
+            raise ValueError(f'无效的IP范围：{value}')
+        return start, end
+    parts = value.rstrip('*').rstrip('.').split('.')
+    if len(parts) < 4:
+        # 前缀按网段处理，例如10.0.等同于10.0.0.0/16
+        network = ipaddress.IPv4Network(f'{".".join(parts + ["0"] * (4 - len(parts)))}/{8 * len(parts)}')
+        return network.network_address, network.broadcast_address
+    address = ipaddress.IPv4Address(value)
+    return address, address
+
+
 def query_condition(sql, params: dict, column: Column, field_name=None, op_func=None, op_type=None):
     """
     添加查询参数
@@ -601,6 +924,26 @@ def query_condition(sql, params: dict, column: Column, field_name=None, op_func=
                     return sql.where(or_(*[column.like(f'%{x}%') for x in param]))
                 else:
                     return sql.where(column.like(f'%{param}%'))
+            elif op_type == 'ilike':
+                # 不区分大小写的包含查询，可以使用trigram索引（trigram_index）
+                if isinstance(param, list):
+                    return sql.where(or_(*[column.ilike(contains_pattern(x), escape='\\') for x in param]))
+                else:
+                    return sql.where(column.ilike(contains_pattern(param), escape='\\'))
+            elif op_type == 'similar':
+                # pg_trgm的相似度查询（阈值为pg_trgm.similarity_threshold），可以使用trigram索引
+                return sql.where(column.op('%')(param))
+            elif op_type == 'ip':
+                # 转为IPv4列上的数值范围，可以使用minmax索引，不需要逐行转为字符串匹配
+                if not (values := [x for x in (param if isinstance(param, list) else [param]) if x]):
+                    return sql
+                conditions = []
+                for start, end in map(ip_bounds, values):
+                    if start == end:
+                        conditions.append(column == func.toIPv4(str(start)))
+                    else:
+                        conditions.append(column.between(func.toIPv4(str(start)), func.toIPv4(str(end))))
+                return sql.where(or_(*conditions))
             elif op_type == 'in':
                 return sql.where(column.in_(param))
             elif op_type == 'notin':
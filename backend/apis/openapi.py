@@ -0,0 +1,153 @@
+"""
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+File Name   : openapi.py
+Author      : jinming.yang
+Description : 在应用内提供OpenAPI文档（/openapi.json）
+文档按蓝图分别生成并缓存，整体预先序列化、压缩，ETag由接口及参数定义的指纹计算得到
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+"""
+import gzip
+import hashlib
+import os
+import sys
+import threading
+from enum import Enum
+
+from flask import Blueprint
+from flask import current_app
+from flask import request
+from flask import Response
+
+from config import OPENAPI_TITLE
+from config import OPENAPI_VERSION
+from .common import ParamDefine
+from .common import ParamSchema
+
+bp = Blueprint('OpenAPI', __name__)
+
+
+def _describe(value):
+    """
+    生成参数定义的稳定描述（不依赖对象的内存地址），用于计算指纹
+    """
+    if ParamSchema.is_schema(value):
+        value = value.define
+    if isinstance(value, ParamDefine):
+        return 'ParamDefine', _describe(value.type), value.required, value.comment, value.key, repr(
+            getattr(value, 'default', None))
+    if isinstance(value, dict):
+        return tuple((key, _describe(item)) for key, item in value.items())
+    if hasattr(value, '__origin__'):
+        # typing.List[...]、typing.Dict[...]等
+        return repr(value.__origin__), tuple(_describe(item) for item in value.__args__)
+    if isinstance(value, type):
+        if issubclass(value, Enum):
+            return value.__qualname__, tuple(item.name for item in value)
+        return f'{value.__module__}.{value.__qualname__}'
+    return repr(value)
+
+
+def _load_generator():
+    """
+    导入openapi目录下的文档生成方法（镜像中openapi目录在工作目录下，开发环境中与backend目录同级）
+    """
+    try:
+        from openapi.main import get_apispec
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        from openapi.main import get_apispec
+    from openapi.schemas import OpenApiDefine
+    from openapi.schemas import OpenApiInfo
+    return get_apispec, OpenApiDefine, OpenApiInfo
+
+
+class OpenApiCache:
+    """
+    OpenAPI文档缓存
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fragments = {}  # {蓝图名称: (指纹, tags, paths)}
+        self._components = None
+        self._document = None  # (ETag, JSON, gzip压缩后的JSON)
+
+    @staticmethod
+    def fingerprints(app) -> dict:
+        """
+        计算每个蓝图的接口及参数定义的指纹
+        Returns:
+            {蓝图名称: 指纹}
+        """
+        definitions = {name: [] for name in app.blueprints}
+        for rule in app.url_map.iter_rules():
+            function = app.view_functions.get(rule.endpoint)
+            if apispec := getattr(function, '__apispec__', None):
+                definitions[rule.endpoint.split('.')[0]].append((
+                    rule.rule,
+                    tuple(sorted(rule.methods)),
+                    (function.__doc__ or '').strip(),
+                    tuple((key, _describe(value)) for key, value in apispec.items()),
+                ))
+        return {name: hashlib.sha1(repr(sorted(items)).encode()).hexdigest() for name, items in definitions.items()}
+
+    def invalidate(self, blueprint: str = None):
+        """
+        清除缓存（默认全部），下次访问时重新生成
+        """
+        with self._lock:
+            if blueprint:
+                self._fragments.pop(blueprint, None)
+            else:
+                self._fragments.clear()
+                self._components = None
+            self._document = None
+
+    def get(self, app):
+        """
+        获取文档，不存在或（调试模式下）接口定义发生变化时只重新生成变化的蓝图
+        Returns:
+            (ETag, JSON, gzip压缩后的JSON)
+        """
+        if self._document is not None and not app.debug:
+            return self._document
+        with self._lock:
+            fingerprints = self.fingerprints(app)
+            changed = [name for name, value in fingerprints.items() if self._fragments.get(name, (None,))[0] != value]
+            if self._document is None or changed or fingerprints.keys() != self._fragments.keys():
+                get_apispec, define_cls, info_cls = _load_generator()
+                info = info_cls(OPENAPI_TITLE, OPENAPI_VERSION)
+                for name in changed:
+                    spec = get_apispec(app, info, blueprint=name)
+                    self._fragments[name] = (fingerprints[name], spec.tags, spec.paths)
+                    if self._components is None:
+                        self._components = spec.components
+                for name in self._fragments.keys() - fingerprints.keys():
+                    del self._fragments[name]
+                tags, paths = [], {}
+                for name in fingerprints:
+                    tags.extend(self._fragments[name][1])
+                    paths.update(self._fragments[name][2])
+                document = define_cls(info, paths=paths, tags=tags, components=self._components)
+                body = document.dumps().encode('utf-8')
+                etag = hashlib.sha1(repr(sorted(fingerprints.items())).encode()).hexdigest()
+                self._document = (etag, body, gzip.compress(body))
+            return self._document
+
+
+OpenApi = OpenApiCache()
+
+
+@bp.route('/openapi.json', methods=['GET'])
+def get_openapi():
+    """
+    OpenAPI文档
+    """
+    etag, body, compressed = OpenApi.get(current_app)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    if 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+        body = compressed
+    return Response(body, status=200, headers=headers, mimetype='application/json')
@@ -41,6 +41,7 @@ class PaginateResponseSchema(ParamSchema):
     """
     分页类响应共同参数定义
     """
+    extra = {}  # 子类追加的响应字段
 
     def __init__(self, detail):
         """
@@ -51,4 +52,17 @@ class PaginateResponseSchema(ParamSchema):
         self.define = ParamDefine({
             'total': ParamDefine(int, True, '总数'),
             'data': ParamDefine(List[detail], True, '数据列表'),
-        }, True)
+        } | self.extra, True)
+
+
+class SampledPaginateResponseSchema(PaginateResponseSchema):
+    """
+    支持采样查询（sample参数）的分页类响应参数定义
+    """
+    extra = {
+        'sample': ParamDefine({
+            'rate': ParamDefine(float, True, '采样比例'),
+            'confidence': ParamDefine(float, True, '置信度'),
+            'error': ParamDefine(int, True, '总数的误差范围（±）'),
+        }, False, '采样信息（采样查询时总数为估算值）'),
+    }
@@ -1,5 +1,3 @@
-from io import BytesIO
-
 from flask_jwt_extended import create_access_token
 from flask_jwt_extended import create_refresh_token
 from flask_jwt_extended import get_jwt_identity
@@ -31,8 +29,10 @@ def post_login(**kwargs):
     """
     if captcha := Redis.get(f'captcha:{kwargs["random"]}'):
         if captcha == kwargs['captcha'].lower():
-            if user := execute_sql(select(User).where(User.account == kwargs['account']), many=False):
-                if user.check_password(kwargs['password']):
+            sql = select(User).where(User.account == kwargs['account'])
+            # 使用接口的session查询，登录时更新的密码哈希可以随接口一起提交
+            if user := execute_sql(sql, many=False, session=kwargs['oltp_session']):
+                if PasswordHasher().check(user, kwargs['password']):
                     return {
                         'username': user.username,
                         'role': user.role,
@@ -55,11 +55,9 @@ def get_captcha(**kwargs):
     """
     获取验证码
     """
-    img, code = ImageCode().draw_verify_code()
-    with BytesIO() as imgio:
-        img.save(imgio, 'png')
-        Redis.set(f'captcha:{kwargs["random"]}', code.lower(), ex=300)
-        return imgio.getvalue()
+    code, image = CaptchaPool().pop()
+    Redis.set(f'captcha:{kwargs["random"]}', code.lower(), ex=300)
+    return image
 
 
 @bp.route('/refresh', methods=['POST'])
@@ -21,7 +21,8 @@ bp = get_blueprint(__name__, '系统管理')
         'phone': ParamDefine(str, True, '手机号'),
         'email': ParamDefine(str, True, '邮箱'),
     }, True)),
-    permission={RoleEnum.Admin}
+    permission={RoleEnum.Admin},
+    coalesce=True
 )
 def get_users(**kwargs):
     """
@@ -39,7 +40,9 @@ def get_users(**kwargs):
         .where(User.valid == true())
     )
     if keyword := kwargs.get('keyword'):
-        sql = sql.where(User.account.like(f'%{keyword}%') | User.username.like(f'%{keyword}%'))
+        # 与valid条件一起可以使用User上的trigram部分索引
+        pattern = contains_pattern(keyword)
+        sql = sql.where(User.account.ilike(pattern, escape='\\') | User.username.ilike(pattern, escape='\\'))
     return paginate_query(sql, kwargs, False)
 
 
@@ -62,7 +65,7 @@ def post_user(**kwargs):
     新建用户
     """
     kwargs['role'] = RoleEnum.User
-    kwargs['password'] = User.generate_hash(kwargs['password'])
+    kwargs['password'] = PasswordHasher().generate(kwargs['password'])
     return orm_create(User, kwargs)
 
 
@@ -114,9 +117,9 @@ def put_password(**kwargs):
     修改密码
     """
     user = kwargs['user']
-    if not user.check_password(kwargs['old']):
+    if not PasswordHasher().check(user, kwargs['old']):
         raise APIErrorResponse(403, msg='用户名或密码错误')
-    user.password = User.generate_hash(kwargs['new'])
+    user.password = PasswordHasher().generate(kwargs['new'])
 
 
 @bp.route('/users/<uid>/password', methods=['PUT'])
@@ -133,22 +136,23 @@ def reset_password(uid, **kwargs):
     """
     session: Session = kwargs['oltp_session']
     user = session.get(User, uid)
-    user.password = User.generate_hash(kwargs['password'])
+    user.password = PasswordHasher().generate(kwargs['password'])
 
 
 @bp.route('/logs', methods=['GET'])
 @api_wrapper(
     request_param=PaginateRequestSchema({
         'sort': ParamDefine(List[str], False, '排序字段', default=['-created_at']),
-        'ip': ParamDefine(str, False, 'IP'),
+        'ip': ParamDefine(str, False, 'IP，支持单个IP、CIDR（10.0.0.0/24）、范围（10.0.0.1-10.0.0.50）、前缀（10.0.）'),
         'account': ParamDefine(str, False, '账号'),
         'username': ParamDefine(str, False, '用户名'),
         'method': ParamDefine(List[str], False, '请求类型'),
         'status': ParamDefine(List[int], False, '状态码'),
-        'created_at_start': ParamDefine(datetime, False),
-        'created_at_end': ParamDefine(datetime, False),
+        'created_at_start': ParamDefine(datetime, False, '开始时间，未指定时默认从当天0点开始（OLAP_DEFAULT_WINDOW_DAYS）'),
+        'created_at_end': ParamDefine(datetime, False, '结束时间'),
+        'sample': ParamDefine(float, False, '采样比例（0-1），用于快速估算', valid=lambda x: 0 < x <= 1),
     }),
-    response_param=PaginateResponseSchema(ParamDefine({
+    response_param=SampledPaginateResponseSchema(ParamDefine({
         'account': ParamDefine(str, True, '账号'),
         'username': ParamDefine(str, True, '用户名'),
         'created_at': ParamDefine(datetime, True, '发生时间'),
@@ -159,17 +163,21 @@ def reset_password(uid, **kwargs):
         'duration': ParamDefine(int, True, '响应耗时'),
         'source_ip': ParamDefine(str, True, '源IP'),
     }, True)),
-    permission={RoleEnum.Admin}
+    permission={RoleEnum.Admin},
+    coalesce=True
 )
 def get_logs(**kwargs):
     """
     日志列表
     """
 
+    users = DataLoader.of(User)
+
     def format_func(x):
+        # 只登记用户ID，响应序列化时一次查询当前页涉及的用户
         return {
-            'account': user_dict.get(x[0]).account if x[0] in user_dict else '',
-            'username': user_dict.get(x[0]).username if x[0] in user_dict else '',
+            'account': users.load(x[0], 'account', ''),
+            'username': users.load(x[0], 'username', ''),
             'created_at': x[1],
             'method': x[2],
             'blueprint': x[3],
@@ -194,16 +202,85 @@ def get_logs(**kwargs):
     if account or username:
         stmt = select(User)
         if account:
-            stmt = stmt.where(User.account.like(f'%{account}%'))
+            stmt = stmt.where(User.account.ilike(contains_pattern(account), escape='\\'))
         if username:
-            stmt = stmt.where(User.username.like(f'%{username}%'))
-        user_dict = {u.id: u for u in execute_sql(stmt, many=True, scalar=True)}
-        sql = sql.where(ApiRequestLogs.user_id.in_(user_dict.keys()))
-    else:
-        user_dict = {u.id: u for u in execute_sql(select(User), many=True, scalar=True)}
-    if ip := kwargs.get('ip'):
-        sql = sql.where(func.IPv4NumToString(ApiRequestLogs.source_ip).like(f'%{ip}'))
+            stmt = stmt.where(User.username.ilike(contains_pattern(username), escape='\\'))
+        user_list = execute_sql(stmt, many=True, scalar=True, record=True)
+        users.prime(user_list)
+        sql = sql.where(ApiRequestLogs.user_id.in_([u.id for u in user_list]))
+    sql = query_condition(sql, kwargs, ApiRequestLogs.source_ip, 'ip', op_type='ip')
     sql = query_condition(sql, kwargs, ApiRequestLogs.method, op_type='in')
     sql = query_condition(sql, kwargs, ApiRequestLogs.status, op_type='in')
-    sql = query_condition(sql, kwargs, ApiRequestLogs.created_at, op_type='datetime')
+    sql = time_window(sql, kwargs, ApiRequestLogs.created_at, kwargs['user'].role)
     return paginate_query(sql, kwargs, False, format_func, session=kwargs['olap_session'])
+
+
+@bp.route('/logs/summary', methods=['GET'])
+@api_wrapper(
+    request_param=ParamDefine({
+        'created_at_start': ParamDefine(datetime, False, '开始时间，未指定时默认从当天0点开始（OLAP_DEFAULT_WINDOW_DAYS）'),
+        'created_at_end': ParamDefine(datetime, False, '结束时间'),
+        'sample': ParamDefine(float, False, '采样比例（0-1），用于快速估算', valid=lambda x: 0 < x <= 1),
+    }),
+    response_param=ParamDefine({
+        'total': ParamDefine(int, True, '请求总数'),
+        'duration': ParamDefine(Any, True, '响应耗时统计'),
+        'method': ParamDefine(Any, True, '各请求类型的数量'),
+        'status': ParamDefine(Any, True, '各响应状态的数量'),
+        'account': ParamDefine(Any, True, '请求数量最多的账号'),
+        'sample': ParamDefine(Any, False, '采样信息（采样查询时数量为估算值）'),
+    }),
+    permission={RoleEnum.Admin},
+    coalesce=True
+)
+def get_logs_summary(**kwargs):
+    """
+    日志统计
+    """
+    sql = select(ApiRequestLogs.user_id, ApiRequestLogs.method, ApiRequestLogs.status, ApiRequestLogs.duration)
+    sql = time_window(sql, kwargs, ApiRequestLogs.created_at, kwargs['user'].role)
+    sql = sample_condition(sql, kwargs)
+    # 数据量大，按列查询并向量化统计
+    result = execute_sql(sql, columnar=True)
+    # 只查询结果中出现的用户
+    stmt = select(User).where(User.id.in_(result.unique('user_id')))
+    accounts = {u.id: u.account for u in execute_sql(stmt, many=True, scalar=True, record=True)}
+    result.map('user_id', accounts, '', alias='account')
+    total, sample = sample_estimate(len(result), kwargs.get('sample'))
+    summary = {
+        'total': total,
+        'duration': result.describe('duration'),
+        'method': result.value_counts('method'),
+        'status': result.value_counts('status'),
+        'account': result.value_counts('account', top=10),
+    }
+    if sample:
+        # 采样查询时各项数量按采样比例放大
+        for key in ('method', 'status', 'account'):
+            summary[key] = {k: round(v / sample['rate']) for k, v in summary[key].items()}
+        summary['sample'] = sample
+    return summary
+
+
+@bp.route('/pool', methods=['GET'])
+@api_wrapper(
+    response_param=ParamDefine(Any, True, '连接池状态'),
+    permission={RoleEnum.Admin}
+)
+def get_pool(**kwargs):
+    """
+    数据库连接池状态
+    """
+    return OLTPEngine.pool.telemetry()
+
+
+@bp.route('/coalesce', methods=['GET'])
+@api_wrapper(
+    response_param=ParamDefine(Any, True, '各接口的请求合并统计'),
+    permission={RoleEnum.Admin}
+)
+def get_coalesce(**kwargs):
+    """
+    请求合并统计
+    """
+    return SingleFlight().stats
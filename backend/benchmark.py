@@ -0,0 +1,423 @@
+"""
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+File Name   : benchmark.py
+Author      : jinming.yang
+Description : 性能基准测试
+    - 默认模式：离线执行请求参数解析、响应序列化、model转dict等常用方法，输出每次调用的耗时及内存分配，不需要数据库
+    - olap模式：连接ClickHouse执行与日志列表（get_logs）相同的查询，从system.query_log读取读取的行数、
+      数据块（mark）数及耗时，与复制到旧表结构（排序键以user_id开头、没有投影）中的相同数据对比
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+Usage:
+    benchmark.py [--number=<number>] [--repeat=<repeat>] [--filter=<keyword>]
+    benchmark.py olap [--repeat=<repeat>] [--filter=<keyword>]
+    benchmark.py -h | --help
+Options:
+    --number=<number>            每轮执行次数 [default: 200]
+    --repeat=<repeat>            重复轮数（取最快的一轮） [default: 5]
+    --filter=<keyword>           只执行名称中包含该关键字的用例
+"""
+import gc
+import json
+import random
+import timeit
+import tracemalloc
+from datetime import datetime
+from datetime import timedelta
+from ipaddress import IPv4Address
+from time import perf_counter_ns
+from typing import List
+from uuid import uuid4
+
+from docopt import docopt
+from sqlalchemy import func
+from sqlalchemy import select
+
+from apis.common import _add_sort
+from apis.common import _req_params
+from apis.common import _resp_params
+from apis.common import ParamDefine
+from apis.common import query_condition
+from apis.common import time_window
+from apis.v1 import PaginateRequestSchema
+from apis.v1 import PaginateResponseSchema
+from defines import *
+from utils import JSONExtensionEncoder
+from utils.functions import to_dict
+from utils.functions import to_obj
+
+# 固定随机种子及基准时间，保证每次运行的数据完全一致
+_random = random.Random(20231001)
+_NOW = datetime(2023, 10, 1, 12, 0, 0)
+_PAGE_SIZE = 100
+
+
+def _make_users(count=_PAGE_SIZE):
+    """
+    生成用户实例
+    """
+    users = []
+    for i in range(count):
+        user = User()
+        user.id = f'{i:012x}'
+        user.account = f'account_{i}'
+        user.username = f'用户{i}'
+        user.role = _random.choice(list(RoleEnum))
+        user.phone = f'138{i:08d}'
+        user.email = f'user{i}@example.com'
+        user.password = '-'
+        user.valid = True
+        user.created_at = _NOW - timedelta(days=i)
+        user.updated_at = _NOW - timedelta(hours=i)
+        users.append(user)
+    return users
+
+
+def _make_logs(count=_PAGE_SIZE):
+    """
+    生成日志实例
+    """
+    logs = []
+    for i in range(count):
+        log = ApiRequestLogs()
+        log.id = f'{i:032x}'
+        log.user_id = f'{i % 10:012x}'
+        log.created_at = _NOW - timedelta(seconds=i)
+        log.method = _random.choice(list(MethodEnum)).name
+        log.blueprint = '系统管理'
+        log.uri = f'/apis/v1/system/users/{i}'
+        log.status = _random.choice((200, 201, 204, 403, 422))
+        log.duration = _random.randint(1, 500)
+        log.source_ip = IPv4Address(f'10.0.{i // 256}.{i % 256}')
+        logs.append(log)
+    return logs
+
+
+def _make_log_rows(count=_PAGE_SIZE):
+    """
+    生成get_logs经过format_func后的数据结构（大量枚举值）
+    """
+    return [
+        {
+            'account': f'account_{i % 10}',
+            'username': f'用户{i % 10}',
+            'created_at': _NOW - timedelta(seconds=i),
+            'method': _random.choice(list(MethodEnum)),
+            'role': _random.choice(list(RoleEnum)),
+            'language': _random.choice(list(LanguageEnum)),
+            'blueprint': '系统管理',
+            'uri': f'/apis/v1/system/users/{i}',
+            'status': _random.choice((200, 201, 204, 403, 422)),
+            'duration': _random.randint(1, 500),
+            'source_ip': IPv4Address(f'10.0.{i // 256}.{i % 256}'),
+        } for i in range(count)
+    ]
+
+
+# 嵌套的请求参数定义
+_NESTED_REQUEST = ParamDefine({
+    'name': ParamDefine(str, True, '名称', valid=lambda x: len(x) < 64),
+    'role': ParamDefine(RoleEnum, True, '角色'),
+    'tags': ParamDefine(List[str], False, '标签'),
+    'created_at': ParamDefine(datetime, False, '创建时间'),
+    'detail': ParamDefine({
+        'method': ParamDefine(MethodEnum, True, '请求类型'),
+        'status': ParamDefine(List[int], True, '状态码'),
+        'extra': ParamDefine({
+            'language': ParamDefine(LanguageEnum, False, '语言', default=LanguageEnum.ZH),
+            'size': ParamDefine(int, False, '数量', default=10),
+        }),
+    }, True),
+    'items': ParamDefine(List[ParamDefine({
+        'key': ParamDefine(str, True),
+        'value': ParamDefine(int, True),
+    })], False, '子项'),
+}, True)
+_NESTED_SOURCE = {
+    'name': 'benchmark',
+    'role': 'Admin',
+    'tags': [f'tag{i}' for i in range(10)],
+    'created_at': _NOW.strftime('%Y-%m-%d %H:%M:%S'),
+    'detail': {
+        'method': 'GET',
+        'status': [200, 201, 204],
+        'extra': {'language': 'en-US'},
+    },
+    'items': [{'key': f'k{i}', 'value': i} for i in range(20)],
+}
+# 模拟GET请求的分页参数（query参数都是list）
+_PAGINATE_REQUEST = PaginateRequestSchema({
+    'sort': ParamDefine(List[str], False, '排序字段', default=['-created_at']),
+    'ip': ParamDefine(str, False, 'IP'),
+    'account': ParamDefine(str, False, '账号'),
+    'method': ParamDefine(List[str], False, '请求类型'),
+    'status': ParamDefine(List[int], False, '状态码'),
+    'created_at_start': ParamDefine(datetime, False),
+    'created_at_end': ParamDefine(datetime, False),
+})
+_PAGINATE_SOURCE = {
+    'page': ['1'],
+    'size': ['100'],
+    'sort': ['-created_at', 'status'],
+    'account': ['admin'],
+    'method': ['GET', 'POST'],
+    'status': ['200', '403'],
+    'created_at_start': ['2023-09-01 00:00:00'],
+    'created_at_end': ['2023-10-01 00:00:00'],
+}
+_USER_RESPONSE = PaginateResponseSchema(ParamDefine({
+    'id': ParamDefine(str, True, '用户ID'),
+    'account': ParamDefine(str, True, '账号'),
+    'role': ParamDefine(RoleEnum, True, '角色'),
+    'username': ParamDefine(str, True, '用户名'),
+    'phone': ParamDefine(str, True, '手机号'),
+    'email': ParamDefine(str, True, '邮箱'),
+}, True))
+_LOG_RESPONSE = PaginateResponseSchema(ParamDefine({
+    'account': ParamDefine(str, True, '账号'),
+    'username': ParamDefine(str, True, '用户名'),
+    'created_at': ParamDefine(datetime, True, '发生时间'),
+    'method': ParamDefine(MethodEnum, True, '请求类型'),
+    'blueprint': ParamDefine(str, True, '业务模块'),
+    'uri': ParamDefine(str, True, '接口路径'),
+    'status': ParamDefine(int, True, '响应状态'),
+    'duration': ParamDefine(int, True, '响应耗时'),
+    'source_ip': ParamDefine(str, True, '源IP'),
+}, True))
+
+
+def get_cases():
+    """
+    生成全部基准测试用例
+    Returns:
+        (名称, 无参函数) 列表
+    """
+    users = _make_users()
+    logs = _make_logs()
+    log_rows = _make_log_rows()
+    user_page = {'total': len(users), 'data': users}
+    log_page = {'total': len(log_rows), 'data': log_rows}
+    paginate_params = _req_params(_PAGINATE_REQUEST, _PAGINATE_SOURCE, True)
+    log_sql = select(ApiRequestLogs.user_id, ApiRequestLogs.created_at, ApiRequestLogs.status)
+    nested_dict = {'total': _PAGE_SIZE, 'data': [{**row, 'children': [{'id': i} for i in range(3)]} for row in
+                                                 json.loads(json.dumps(log_rows, cls=JSONExtensionEncoder))]}
+    nested_obj = to_obj(nested_dict)
+    user_record = User.record_class()
+    user_rows = [tuple(getattr(u, key) for key in user_record.fields) for u in users]
+    user_records = list(map(user_record.make, user_rows))
+
+    def _query_condition():
+        sql = query_condition(log_sql, paginate_params, ApiRequestLogs.method, op_type='in')
+        sql = query_condition(sql, paginate_params, ApiRequestLogs.status, op_type='in')
+        sql = query_condition(sql, paginate_params, ApiRequestLogs.uri, field_name='account', op_type='like')
+        return query_condition(sql, paginate_params, ApiRequestLogs.created_at, op_type='datetime')
+
+    return [
+        ('_req_params:nested', lambda: _req_params(_NESTED_REQUEST, _NESTED_SOURCE, False)),
+        ('_req_params:paginate', lambda: _req_params(_PAGINATE_REQUEST, _PAGINATE_SOURCE, True)),
+        ('_resp_params:users[100]', lambda: _resp_params(_USER_RESPONSE, user_page)),
+        ('_resp_params:logs[100]', lambda: _resp_params(_LOG_RESPONSE, log_page)),
+        ('JSONExtensionEncoder:logs[100]', lambda: json.dumps(log_rows, cls=JSONExtensionEncoder)),
+        ('JSONExtensionEncoder:users[100]', lambda: json.dumps(users, cls=JSONExtensionEncoder)),
+        ('ModelTemplate.json:User', lambda: users[0].json()),
+        ('ModelTemplate.json:ApiRequestLogs', lambda: logs[0].json()),
+        ('ModelTemplate.json:User[100]', lambda: [u.json() for u in users]),
+        ('ModelRecord.make:User[100]', lambda: list(map(user_record.make, user_rows))),
+        ('ModelRecord.json:User[100]', lambda: [u.json() for u in user_records]),
+        ('query_condition:logs', _query_condition),
+        ('_add_sort', lambda: _add_sort(log_sql, paginate_params)),
+        ('to_dict:page[100]', lambda: to_dict(nested_obj)),
+        ('to_obj:page[100]', lambda: to_obj(nested_dict)),
+    ]
+
+
+# 对比的基准：优化之前的表结构（排序键以user_id开头，没有投影及method、source_ip的跳数索引），
+# 测试时复制最近的数据到该表，与当前的api_request_logs执行相同的查询
+_OLAP_BASELINE_TABLE = 'api_request_logs_benchmark_base'
+_OLAP_BASELINE_DDL = f"""
+CREATE TABLE {_OLAP_BASELINE_TABLE}
+(
+    `id`         UUID,
+    `user_id` LowCardinality(String),
+    `created_at` DateTime64(3),
+    `method` LowCardinality(String),
+    `blueprint` LowCardinality(String),
+    `uri` LowCardinality(String),
+    `status`     Int32,
+    `duration`   Int32,
+    `source_ip`  IPv4,
+
+    INDEX arl_duration_index duration TYPE minmax GRANULARITY 2,
+    INDEX arl_status_code_index status TYPE minmax GRANULARITY 4
+) ENGINE = MergeTree
+      PARTITION BY toYYYYMMDD(created_at)
+      ORDER BY (user_id, created_at, id)
+      SETTINGS index_granularity = 1024
+"""
+_OLAP_DAYS = 7  # 用例查询的最大时间范围（天）
+
+
+def get_olap_cases(user_ids: List[str]):
+    """
+    生成日志列表（/system/logs）常用筛选条件的查询，条件与get_logs相同，总数和按时间倒序的第一页分别作为用例
+    Args:
+        user_ids: 按账号/用户名筛选时匹配到的用户ID
+
+    Returns:
+        (名称, SQL字符串) 列表
+    """
+    start = datetime.now().replace(microsecond=0) - timedelta(days=_OLAP_DAYS)
+    sql = select(
+        ApiRequestLogs.user_id,
+        ApiRequestLogs.created_at,
+        ApiRequestLogs.method,
+        ApiRequestLogs.blueprint,
+        ApiRequestLogs.uri,
+        ApiRequestLogs.status,
+        ApiRequestLogs.duration,
+        ApiRequestLogs.source_ip,
+    )
+    filters = [
+        ('logs:default', {}),
+        (f'logs:{_OLAP_DAYS}d', {'created_at_start': start}),
+        (f'logs:{_OLAP_DAYS}d+status', {'created_at_start': start, 'status': [403, 500]}),
+        (f'logs:{_OLAP_DAYS}d+method+status', {
+            'created_at_start': start, 'method': ['POST', 'DELETE'], 'status': [422],
+        }),
+        (f'logs:{_OLAP_DAYS}d+account', {'created_at_start': start, 'user_id': user_ids}),
+        (f'logs:{_OLAP_DAYS}d+ip', {'created_at_start': start, 'ip': '10.0.0.0/24'}),
+    ]
+    cases = []
+    for name, params in filters:
+        params = {'page': 1, 'size': _PAGE_SIZE, 'sort': ['-created_at'], **params}
+        query = query_condition(sql, params, ApiRequestLogs.user_id, op_type='in')
+        query = query_condition(query, params, ApiRequestLogs.source_ip, 'ip', op_type='ip')
+        query = query_condition(query, params, ApiRequestLogs.method, op_type='in')
+        query = query_condition(query, params, ApiRequestLogs.status, op_type='in')
+        query = time_window(query, params, ApiRequestLogs.created_at, RoleEnum.Admin)
+        cases.append((f'{name}:count', compile_olap(select(func.count()).select_from(query))))
+        cases.append((f'{name}:page', compile_olap(_add_sort(query.limit(params['size']), params))))
+    return cases
+
+
+def measure_olap(client, sql, repeat):
+    """
+    执行查询并从system.query_log读取统计信息
+    Returns:
+        (读取行数, 读取的mark数, 耗时ms)，多次执行取耗时最短的一次
+    """
+    ids = [uuid4().hex for _ in range(repeat)]
+    for query_id in ids:
+        client.execute(sql, settings={'log_queries': 1}, query_id=query_id)
+    client.execute('SYSTEM FLUSH LOGS')
+    rows = client.execute(
+        "SELECT read_rows, ProfileEvents['SelectedMarks'], query_duration_ms FROM system.query_log "
+        "WHERE type = 'QueryFinish' AND query_id IN %(ids)s",
+        {'ids': tuple(ids)},
+    )
+    return min(rows, key=lambda x: x[2])
+
+
+def run_olap(repeat, keyword=None):
+    """
+    执行OLAP查询基准测试并输出结果：先把最近的数据复制到旧表结构的基准表，再对两张表执行相同的查询
+    Args:
+        repeat: 每个查询的执行次数
+        keyword: 用例名称过滤
+
+    Returns:
+        {名称: (基准的统计信息, 当前的统计信息)}
+    """
+    result = {}
+    client = olap_client()
+    print(f'{"case":<32}{"rows(base)":>14}{"rows":>14}{"reduced":>10}{"marks(base)":>13}{"marks":>10}'
+          f'{"ms(base)":>10}{"ms":>8}')
+    try:
+        client.execute(f'DROP TABLE IF EXISTS {_OLAP_BASELINE_TABLE}')
+        client.execute(_OLAP_BASELINE_DDL)
+        client.execute(
+            f'INSERT INTO {_OLAP_BASELINE_TABLE} SELECT * FROM api_request_logs '
+            f'WHERE created_at >= toStartOfDay(now()) - INTERVAL {_OLAP_DAYS} DAY'
+        )
+        client.execute(f'OPTIMIZE TABLE {_OLAP_BASELINE_TABLE} FINAL')
+        user_ids = [row[0] for row in client.execute('SELECT DISTINCT user_id FROM api_request_logs LIMIT 3')]
+        for name, sql in get_olap_cases(user_ids):
+            if keyword and keyword not in name:
+                continue
+            base = measure_olap(client, sql.replace('api_request_logs', _OLAP_BASELINE_TABLE), repeat)
+            current = measure_olap(client, sql, repeat)
+            result[name] = (base, current)
+            reduced = 1 - current[0] / base[0] if base[0] else 0
+            print(f'{name:<32}{base[0]:>14,}{current[0]:>14,}{reduced:>10.1%}{base[1]:>13,}{current[1]:>10,}'
+                  f'{base[2]:>10,}{current[2]:>8,}')
+    finally:
+        client.execute(f'DROP TABLE IF EXISTS {_OLAP_BASELINE_TABLE}')
+        client.disconnect()
+    return result
+
+
+def measure_time(func, number, repeat):
+    """
+    计算单次执行耗时（取最快一轮，执行期间关闭GC，同timeit）
+    Returns:
+        ns/op
+    """
+    timer = timeit.Timer(func, timer=perf_counter_ns)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure_memory(func, number):
+    """
+    通过tracemalloc统计内存分配
+    Returns:
+        (单次执行的峰值分配字节数, 单次执行结果占用的字节数, 单次执行结果占用的内存块数)
+    """
+    func()  # 预热：排除缓存初始化等一次性分配
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peak = 0
+        kept = []
+        before = tracemalloc.take_snapshot()
+        for _ in range(number):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            kept.append(func())
+            peak += tracemalloc.get_traced_memory()[1] - current
+        after = tracemalloc.take_snapshot()
+        stats = after.compare_to(before, 'filename')
+        size = sum(stat.size_diff for stat in stats)
+        blocks = sum(stat.count_diff for stat in stats)
+    finally:
+        tracemalloc.stop()
+    return peak / number, size / number, blocks / number
+
+
+def run(number, repeat, keyword=None):
+    """
+    执行基准测试并输出结果
+    Args:
+        number: 每轮执行次数
+        repeat: 重复轮数
+        keyword: 用例名称过滤
+
+    Returns:
+        {名称: (ns/op, peak B/op, kept B/op, blocks/op)}
+    """
+    result = {}
+    print(f'{"case":<36}{"ns/op":>14}{"peak B/op":>14}{"kept B/op":>14}{"blocks/op":>12}')
+    for name, func in get_cases():
+        if keyword and keyword not in name:
+            continue
+        ns = measure_time(func, number, repeat)
+        peak, kept, blocks = measure_memory(func, max(number // 10, 1))
+        result[name] = (ns, peak, kept, blocks)
+        print(f'{name:<36}{ns:>14,.0f}{peak:>14,.0f}{kept:>14,.0f}{blocks:>12,.1f}')
+    return result
+
+
+if __name__ == '__main__':
+    options = docopt(__doc__, version='Benchmark v1.0')
+    if options['olap']:
+        run_olap(int(options['--repeat']), options['--filter'])
+    else:
+        run(int(options['--number']), int(options['--repeat']), options['--filter'])
@@ -3,16 +3,27 @@ Usage:
     command.py user [--account=<admin>] [--username=<username>] [--password=<password>]
     command.py init
     command.py kafka
+    command.py profile [--module=<module>] [--top=<top>]
     command.py -h | --help
 Options:
     --account=<admin>            初始账号 [default: admin]
     --username=<username>        初始用户名 [default: 默认管理员]
     --password=<password>        初始用户密码 [default: m/W*0-nS0t5]
+    --module=<module>            分析启动耗时的模块 [default: start]
+    --top=<top>                  输出耗时最多的包的数量 [default: 20]
 """
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
 from docopt import docopt
 from sqlalchemy.orm import Session
 
+import workers  # 导入即完成Kafka处理函数的注册
 from defines import *
+from utils import KafkaWorker
 from utils import exceptions
 from utils import generate_key
 
@@ -51,12 +62,75 @@ def init_database():
     pass
 
 
+# 在子进程中执行：记录每个模块开始导入时的RSS，导入完成后输出总耗时及RSS
+_PROFILE_SCRIPT = """
+import json, os, sys, time
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+events = []
+sys.addaudithook(lambda event, args: events.append((args[0], rss())) if event == 'import' else None)
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+events.append(('', rss()))
+print(json.dumps({{'elapsed': elapsed, 'rss': events[-1][1], 'events': events}}))
+"""
+
+
+def profile_startup(module, top):
+    """
+    分析冷启动时各个包的导入耗时及内存占用
+    Args:
+        module: 导入的模块，例如start、command
+        top: 输出耗时最多的前top个包
+
+    Returns:
+        None
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROFILE_SCRIPT.format(module=module)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+    # 按顶层包汇总：耗时取-X importtime的self时间，内存取到下一个模块开始导入时RSS的增量
+    times, memory = defaultdict(int), defaultdict(int)
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('| imported package'):
+            self_us, _, name = line[12:].split('|')
+            times[name.strip().split('.')[0]] += int(self_us)
+    events = profile['events']
+    for (name, rss), (_, next_rss) in zip(events, events[1:]):
+        memory[name.split('.')[0]] += next_rss - rss
+    print(f'{"package":<32}{"self ms":>10}{"RSS KB":>10}')
+    for name in sorted(times, key=times.get, reverse=True)[:top]:
+        print(f'{name:<32}{times[name] / 1000:>10.1f}{memory[name] / 1024:>10.0f}')
+    print(f'{"total":<32}{profile["elapsed"] * 1000:>10.1f}{profile["rss"] / 1024:>10.0f}')
+
+
 if __name__ == '__main__':
     options = docopt(__doc__, version='Command v1.0')
-    if options['user']:
-        init_user(options['--account'], options['--username'], options['--password'])
-    elif options['init']:
-        init_database()
-    else:
-        print('Missed Options')
+    try:
+        if options['user']:
+            init_user(options['--account'], options['--username'], options['--password'])
+        elif options['init']:
+            init_database()
+        elif options['kafka']:
+            KafkaWorker().run()
+        elif options['profile']:
+            profile_startup(options['--module'], int(options['--top']))
+        else:
+            print('Missed Options')
+    finally:
+        # 只会关闭命令执行过程中实际用到的连接
+        Resources.close()
     print('Success!')
@@ -1,2 +1,3 @@
 from .enums import *
 from .models import *
+from .resources import *
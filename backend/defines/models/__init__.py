@@ -5,26 +5,43 @@ Author      : jinming.yang
 Description : 在__init__.py中统一导入
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 """
+from .base import ModelRecord
 from .base import ModelTemplate
+from .base import OLAPClients
 from .base import OLAPEngine
 from .base import OLAPModelBase
 from .base import OLTPEngine
 from .base import OLTPModelBase
+from .base import OLTPRouter
+from .base import compile_olap
+from .base import olap_client
+from .base import pin_primary
+from .base import reset_read_your_writes
+from .base import set_read_your_writes
 from .business import User
 from .system import ApiRequestLogs
 
 _base = [
+    'ModelRecord',
     'ModelTemplate',
+    'OLAPClients',
     'OLAPEngine',
     'OLAPModelBase',
     'OLAPModelsDict',
     'OLTPEngine',
     'OLTPModelBase',
     'OLTPModelsDict',
+    'OLTPRouter',
+    'compile_olap',
+    'olap_client',
+    'pin_primary',
+    'reset_read_your_writes',
+    'set_read_your_writes',
 ]
 
 OLAPModelsDict = {x.__name__: x for x in OLAPModelBase.__subclasses__()}
 OLTPModelsDict = {x.__name__: x for x in OLTPModelBase.__subclasses__()}
 
+
 # 限制 from models import * 时导入的内容
 __all__ = _base + list(OLAPModelsDict.keys()) + list(OLTPModelsDict.keys())
@@ -8,28 +8,458 @@ Model分为两类，
     - OLAP: 联机事务处理
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 """
+import itertools
+import sys
+import threading
+import traceback
+from contextvars import ContextVar
 from datetime import datetime
+from operator import attrgetter
+from time import perf_counter
 from typing import Optional
 from uuid import uuid4
 
-from clickhouse_driver import Client
+from loguru import logger
 from sqlalchemy import DateTime
 from sqlalchemy import String
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy import func
+from sqlalchemy import Index
 from sqlalchemy import JSON
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import StrCompileDialect
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
-from sqlalchemy.orm.collections import InstrumentedList
 from sqlalchemy.orm.properties import ColumnProperty
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.compiler import StrSQLCompiler
 from typing_extensions import Annotated
 
 from config import DATABASE_OLAP_URI
+from config import DATABASE_OLTP_REPLICA_URIS
 from config import DATABASE_OLTP_URI
+from config import OLAP_CLIENT_POOL_SIZE
+from config import OLTP_MAX_OVERFLOW
+from config import OLTP_POOL_PRE_PING
+from config import OLTP_POOL_RECYCLE
+from config import OLTP_POOL_SIZE
+from config import OLTP_POOL_TIMEOUT
+from config import OLTP_REPLICA_CHECK_INTERVAL
+from config import OLTP_REPLICA_MAX_LAG
+from config import OLTP_REPLICA_POLICY
+from config import OLTP_SESSION_WARN_SECONDS
+from ..resources import Resources
 
-OLAPEngine = Client.from_url(DATABASE_OLAP_URI)
-OLTPEngine = create_engine(DATABASE_OLTP_URI, pool_size=150, pool_recycle=60)
+
+class MonitoredQueuePool(QueuePool):
+    """
+    记录连接获取的等待时间以及连接占用情况的连接池
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._held = {}  # 连接记录: (获取时间, 获取连接时的调用栈)
+
+    def connect(self):
+        start = perf_counter()
+        connection = super().connect()
+        now = perf_counter()
+        # 只记录调用栈的位置，需要输出时再读取源码行
+        frames = traceback.walk_stack(sys._getframe(1))
+        stack = traceback.StackSummary.extract(frames, limit=30, lookup_lines=False)
+        with self._stats_lock:
+            self._checkouts += 1
+            self._wait_total += now - start
+            self._wait_max = max(self._wait_max, now - start)
+            self._held[connection._connection_record] = (now, stack)
+        return connection
+
+    def _do_return_conn(self, record):
+        with self._stats_lock:
+            started, stack = self._held.pop(record, (None, None))
+        if started and (held := perf_counter() - started) > OLTP_SESSION_WARN_SECONDS:
+            logger.warning(f'数据库连接占用了{held:.1f}秒，获取位置：\n{self._format_stack(stack)}')
+        super()._do_return_conn(record)
+
+    @staticmethod
+    def _format_stack(stack) -> str:
+        return ''.join(traceback.StackSummary.from_list(list(reversed(stack))).format())
+
+    def telemetry(self) -> dict:
+        """
+        连接池的运行状态
+        Returns:
+            {
+                'size': 连接池大小,
+                'checked_in': 空闲连接数,
+                'checked_out': 使用中的连接数,
+                'overflow': 溢出的连接数,
+                'checkouts': 累计获取连接次数,
+                'wait_avg_ms': 获取连接的平均等待时间,
+                'wait_max_ms': 获取连接的最长等待时间,
+                'leaks': 占用时间超过阈值的连接及其获取位置,
+            }
+        """
+        now = perf_counter()
+        with self._stats_lock:
+            checkouts, wait_total, wait_max = self._checkouts, self._wait_total, self._wait_max
+            held = list(self._held.values())
+        return {
+            'size': self.size(),
+            'checked_in': self.checkedin(),
+            'checked_out': self.checkedout(),
+            'overflow': max(self.overflow(), 0),
+            'checkouts': checkouts,
+            'wait_avg_ms': round(wait_total / checkouts * 1000, 3) if checkouts else 0,
+            'wait_max_ms': round(wait_max * 1000, 3),
+            'leaks': [
+                {'seconds': round(now - started, 1), 'stack': self._format_stack(stack)}
+                for started, stack in held if now - started > OLTP_SESSION_WARN_SECONDS
+            ],
+        }
+
+
+def create_oltp_engine(uri: str) -> Engine:
+    """
+    按照连接池配置创建OLTP引擎
+    """
+    return create_engine(
+        uri,
+        poolclass=MonitoredQueuePool,
+        pool_size=OLTP_POOL_SIZE,
+        max_overflow=OLTP_MAX_OVERFLOW,
+        pool_timeout=OLTP_POOL_TIMEOUT,
+        pool_recycle=OLTP_POOL_RECYCLE,
+        pool_pre_ping=OLTP_POOL_PRE_PING,
+    )
+
+
+# 读写一致（read-your-writes）：开启后一旦在主库发生写操作，当前请求后续的查询都固定走主库
+_read_your_writes = ContextVar('read_your_writes', default=False)
+_primary_pinned = ContextVar('primary_pinned', default=False)
+
+
+def set_read_your_writes(enabled: bool = True):
+    """
+    设置当前上下文是否开启读写一致
+    Args:
+        enabled: 是否开启
+
+    Returns:
+        用于恢复设置的token元组
+    """
+    return _read_your_writes.set(enabled), _primary_pinned.set(False)
+
+
+def reset_read_your_writes(tokens):
+    """
+    恢复set_read_your_writes之前的设置
+    """
+    _read_your_writes.reset(tokens[0])
+    _primary_pinned.reset(tokens[1])
+
+
+def pin_primary():
+    """
+    当前上下文后续的查询固定走主库
+    """
+    _primary_pinned.set(True)
+
+
+# 副本的复制延迟（秒）：已接收的WAL全部回放完时没有延迟（主库没有写入时回放时间会一直变旧，不能作为延迟）
+_REPLICA_LAG_SQL = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class _Replica:
+    """
+    只读副本及其健康状态
+    """
+
+    def __init__(self, uri):
+        self.engine = create_oltp_engine(uri)
+        self.lag = 0.0
+        self.checked_at = 0.0
+        self.unavailable_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        now = perf_counter()
+        if now < self.unavailable_until:
+            return False
+        if now - self.checked_at >= OLTP_REPLICA_CHECK_INTERVAL:
+            self.checked_at = now
+            if self.engine.dialect.name == 'postgresql':
+                try:
+                    with self.engine.connect() as conn:
+                        self.lag = float(conn.execute(_REPLICA_LAG_SQL).scalar() or 0)
+                except Exception as ex:
+                    self.mark_failed(ex)
+                    return False
+        return self.lag <= OLTP_REPLICA_MAX_LAG
+
+    def mark_failed(self, ex=None):
+        """
+        副本异常时一段时间内不再使用
+        """
+        self.unavailable_until = perf_counter() + OLTP_REPLICA_CHECK_INTERVAL
+        logger.warning(f'OLTP只读副本不可用：{self.engine.url!r}，{ex}')
+
+
+class ReplicaRouter:
+    """
+    OLTP读写分离：查询按策略分配到可用的只读副本，没有可用副本时回退到主库
+    """
+    policies = {}
+
+    def __init__(self, primary: Engine, uris: list, policy: str):
+        self.primary = primary
+        self.replicas = [_Replica(uri) for uri in uris]
+        self.policy = self.policies[policy]()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def register_policy(cls, name: str):
+        """
+        装饰器：注册副本选择策略，策略实例被调用时接收可用副本列表，返回其中一个
+        """
+
+        def decorator(policy_cls):
+            cls.policies[name] = policy_cls
+            return policy_cls
+
+        return decorator
+
+    def get_engine(self) -> Engine:
+        """
+        获取执行查询的引擎
+        """
+        if self.replicas and not _primary_pinned.get():
+            if replicas := [replica for replica in self.replicas if replica.available]:
+                with self._lock:
+                    return self.policy(replicas).engine
+        return self.primary
+
+    def mark_failed(self, engine: Engine, ex=None):
+        """
+        标记副本异常（查询失败时调用）
+        """
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.mark_failed(ex)
+
+    def dispose(self, close: bool = True):
+        """
+        释放副本的连接池
+        """
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+
+
+@ReplicaRouter.register_policy('round_robin')
+class RoundRobinPolicy:
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def __call__(self, replicas):
+        return replicas[next(self._counter) % len(replicas)]
+
+
+@ReplicaRouter.register_policy('least_connections')
+class LeastConnectionsPolicy:
+    def __call__(self, replicas):
+        return min(replicas, key=lambda replica: replica.engine.pool.checkedout())
+
+
+class OLAPCompiler(StrSQLCompiler):
+    """
+    OLAP（ClickHouse）的SQL编译：表的hint原样输出在表名之后，用于SAMPLE等子句
+    """
+
+    def get_from_hint_text(self, table, text):
+        return text
+
+    def render_literal_value(self, value, type_):
+        # ClickHouse字符串中的反斜杠是转义符，需要写成两个才是反斜杠本身（LIKE的转义符才能保留）
+        if isinstance(value, str):
+            value = value.replace('\\', '\\\\')
+        return super().render_literal_value(value, type_)
+
+    @staticmethod
+    def _default_escape(binary):
+        # ClickHouse不支持ESCAPE子句，LIKE默认就以反斜杠转义
+        if binary.modifiers.get('escape') == '\\':
+            binary = binary._clone()
+            binary.modifiers = {key: value for key, value in binary.modifiers.items() if key != 'escape'}
+        return binary
+
+    def visit_like_op_binary(self, binary, operator, **kw):
+        return super().visit_like_op_binary(self._default_escape(binary), operator, **kw)
+
+    def visit_not_like_op_binary(self, binary, operator, **kw):
+        return super().visit_not_like_op_binary(self._default_escape(binary), operator, **kw)
+
+    def visit_ilike_op_binary(self, binary, operator, **kw):
+        return super().visit_ilike_op_binary(self._default_escape(binary), operator, **kw)
+
+    def visit_not_ilike_op_binary(self, binary, operator, **kw):
+        return super().visit_not_ilike_op_binary(self._default_escape(binary), operator, **kw)
+
+
+class OLAPDialect(StrCompileDialect):
+    statement_compiler = OLAPCompiler
+
+
+_OLAP_DIALECT = OLAPDialect()
+
+
+def compile_olap(sql) -> str:
+    """
+    将SQLAlchemy的SQL对象编译为ClickHouse可以执行的SQL字符串
+    Args:
+        sql: SQL对象
+
+    Returns:
+        SQL字符串
+    """
+    return sql.compile(dialect=_OLAP_DIALECT, compile_kwargs={'literal_binds': True}).string
+
+
+def olap_client(url: str = DATABASE_OLAP_URI):
+    """
+    创建ClickHouse客户端（clickhouse_driver导入耗时较长，首次使用时才导入）
+    Args:
+        url: 连接地址
+
+    Returns:
+        clickhouse_driver.Client
+    """
+    from clickhouse_driver import Client
+    return Client.from_url(url)
+
+
+class OLAPClientPool:
+    """
+    ClickHouse客户端池：客户端不能同时执行多个查询，用完归还后由后续请求复用，避免每次都重新建立连接
+    """
+
+    def __init__(self, size: int, url: str = DATABASE_OLAP_URI):
+        self.size = size
+        self.url = url
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取空闲的客户端（没有则创建）
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return olap_client(self.url)
+
+    def release(self, client):
+        """
+        归还客户端，空闲数量已满时断开连接
+        """
+        # 清除并发查询设置的超时，避免影响复用该客户端的查询
+        client.settings.pop('max_execution_time', None)
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(client)
+                return
+        client.disconnect()
+
+    def lazy(self) -> 'LazyOLAPClient':
+        """
+        获取首次使用时才从池中取出的客户端，用完调用其release归还
+        """
+        return LazyOLAPClient(self)
+
+    def close(self):
+        """
+        断开全部空闲客户端
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for client in idle:
+            client.disconnect()
+
+    def discard(self):
+        """
+        子进程丢弃从父进程继承的客户端（不能断开父进程仍在使用的连接）
+        """
+        self._idle = []
+        self._lock = threading.Lock()
+
+
+class LazyOLAPClient:
+    """
+    首次访问属性时才从客户端池获取的OLAP客户端，不查询OLAP的请求不占用客户端
+    """
+    __slots__ = ('_pool', '_client')
+
+    def __init__(self, pool: OLAPClientPool):
+        self._pool = pool
+        self._client = None
+
+    def __getattr__(self, item):
+        if self._client is None:
+            self._client = self._pool.acquire()
+        return getattr(self._client, item)
+
+    def release(self):
+        """
+        归还已经获取的客户端
+        """
+        if self._client is not None:
+            client, self._client = self._client, None
+            self._pool.release(client)
+
+
+def _pin_after_write(conn, cursor, statement, parameters, context, executemany):
+    """
+    开启读写一致时，主库执行写操作后固定后续查询走主库
+    """
+    if _read_your_writes.get() and context and (context.isinsert or context.isupdate or context.isdelete):
+        _primary_pinned.set(True)
+
+
+def _create_primary():
+    engine = create_oltp_engine(DATABASE_OLTP_URI)
+    event.listen(engine, 'after_cursor_execute', _pin_after_write)
+    return engine
+
+
+def _dispose_inherited(engine: Engine):
+    # 子进程不能关闭父进程的连接，只丢弃连接池
+    engine.dispose(close=False)
+
+
+# 连接资源在首次使用时创建，fork后的子进程会重新创建
+OLAPEngine = Resources.register('olap', olap_client, closer=lambda client: client.disconnect())
+OLAPClients = Resources.register(
+    'olap_clients',
+    lambda: OLAPClientPool(OLAP_CLIENT_POOL_SIZE),
+    lambda pool: pool.close(),
+    lambda pool: pool.discard(),
+)
+OLTPEngine = Resources.register('oltp', _create_primary, lambda engine: engine.dispose(), _dispose_inherited)
+OLTPRouter = Resources.register(
+    'oltp_router',
+    lambda: ReplicaRouter(OLTPEngine, DATABASE_OLTP_REPLICA_URIS, OLTP_REPLICA_POLICY),
+    lambda router: router.dispose(),
+    lambda router: router.dispose(close=False),
+)
 
 str_id = Annotated[str, mapped_column(String(16))]
 str_small = Annotated[str, mapped_column(String(32))]
@@ -38,19 +468,154 @@ str_large = Annotated[str, mapped_column(String(128))]
 str_huge = Annotated[str, mapped_column(String(256))]
 
 
+def _json_value(value):
+    return value if value else None
+
+
+def _datetime_value(value):
+    return value if value else '-'
+
+
+class ColumnPlan:
+    """
+    model的列信息，每个model只在首次使用时生成一次
+    """
+    __slots__ = ('columns', 'column_set', 'fields', 'field_set', 'getter', 'converted')
+
+    def __init__(self, mapper):
+        columns, converted = [], []
+        for prop in mapper.iterate_properties:
+            if not isinstance(prop, ColumnProperty):
+                continue
+            columns.append(prop.key)
+            if prop.key.startswith('_'):
+                continue
+            column_type = prop.columns[0].type
+            if isinstance(column_type, JSON):
+                converted.append((prop.key, _json_value))
+            elif isinstance(column_type, DateTime):
+                converted.append((prop.key, _datetime_value))
+        # 全部数据库列（与映射顺序一致）
+        self.columns = tuple(columns)
+        self.column_set = frozenset(columns)
+        # json输出的列（与映射顺序一致）
+        self.fields = tuple(key for key in columns if not key.startswith('_'))
+        self.field_set = frozenset(self.fields)
+        if len(self.fields) == 1:
+            self.getter = lambda obj, key=self.fields[0]: (getattr(obj, key),)
+        else:
+            self.getter = attrgetter(*self.fields)
+        # 需要按列类型转换的列
+        self.converted = tuple(converted)
+
+    def json(self, obj, excluded: set = None) -> dict:
+        """
+        按照列信息将实例转为dict
+        """
+        values = getattr(obj, '__dict__', None)
+        if values is not None and self.field_set <= values.keys():
+            # ORM实例已加载的列直接从实例的__dict__读取，避开instrumentation的属性访问开销
+            result = {key: values[key] for key in self.fields}
+        else:
+            # 只读记录或存在未加载（过期、延迟加载）的列时通过属性访问
+            result = dict(zip(self.fields, self.getter(obj)))
+        for key, converter in self.converted:
+            result[key] = converter(result[key])
+        if excluded:
+            for key in excluded:
+                result.pop(key, None)
+        return result
+
+
+class ModelRecord:
+    """
+    只读的轻量查询结果：由ModelTemplate.record_class按映射列生成__slots__子类，
+    属性名与model一致，但没有identity map及属性instrumentation的开销
+    """
+    __slots__ = ()
+    fields = ()
+    model = None
+    _setters = ()
+    _plan = None
+
+    def __init__(self, *values):
+        for setter, value in zip(self._setters, values):
+            setter(self, value)
+
+    @classmethod
+    def make(cls, row):
+        """
+        根据查询结果行（与fields顺序一致）生成记录
+        """
+        record = cls.__new__(cls)
+        for setter, value in zip(cls._setters, row):
+            setter(record, value)
+        return record
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__}是只读的')
+
+    def __delattr__(self, key):
+        raise AttributeError(f'{type(self).__name__}是只读的')
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{k}={getattr(self, k)!r}" for k in self.fields)})'
+
+    def json(self, excluded: set = None) -> dict:
+        """
+        转为可以序列化的dict对象，结果与ModelTemplate.json一致
+        Args:
+            excluded: 需要忽略的列
+
+        Returns:
+            dict
+        """
+        return self._plan.json(self, excluded)
+
+
 class ModelTemplate:
     """
     提供公共方法的基类
     """
 
+    @classmethod
+    def column_plan(cls) -> ColumnPlan:
+        """
+        获取（首次调用时生成）当前model的列信息
+        """
+        if (plan := cls.__dict__.get('_column_plan')) is None:
+            plan = ColumnPlan(cls.__mapper__)
+            cls._column_plan = plan
+        return plan
+
+    @classmethod
+    def record_class(cls):
+        """
+        获取（首次调用时生成）当前model对应的只读记录类
+        Returns:
+            ModelRecord的子类
+        """
+        if (record_cls := cls.__dict__.get('_record_class')) is None:
+            plan = cls.column_plan()
+            record_cls = type(f'{cls.__name__}Record', (ModelRecord,), {
+                '__slots__': plan.columns,
+                '__module__': cls.__module__,
+                'fields': plan.columns,
+                'model': cls,
+                '_plan': plan,
+            })
+            record_cls._setters = tuple(getattr(record_cls, key).__set__ for key in plan.columns)
+            cls._record_class = record_cls
+        return record_cls
+
     @classmethod
     def get_columns(cls):
         """
         获取类中的全部数据库列的名称
         Returns:
-            列名称列表
+            列名称元组
         """
-        return [prop.key for prop in cls.__mapper__.iterate_properties if isinstance(prop, ColumnProperty)]
+        return cls.column_plan().columns
 
     @classmethod
     def to_property(cls, columns):
@@ -68,25 +633,7 @@ class ModelTemplate:
         Returns:
             dict
         """
-        result = {}
-        ignored_fields = excluded or set()
-        for prop in self.__mapper__.iterate_properties:
-            if not isinstance(prop, ColumnProperty):
-                continue
-            if prop.key.startswith('_') or prop.key in ignored_fields:
-                continue
-            value = getattr(self, prop.key)
-            if isinstance(value, InstrumentedList):
-                result[prop.key] = [item.json() for item in value]
-            elif isinstance(value, ModelTemplate):
-                result[prop.key] = value.json()
-            elif isinstance(prop.columns[0].type, JSON):
-                result[prop.key] = value if value else None
-            elif isinstance(prop.columns[0].type, DateTime):
-                result[prop.key] = value if value else '-'
-            else:
-                result[prop.key] = value
-        return result
+        return self.column_plan().json(self, excluded)
 
 
 class OLTPModelBase(DeclarativeBase, ModelTemplate):
@@ -98,6 +645,28 @@ class OLTPModelBase(DeclarativeBase, ModelTemplate):
     id: Mapped[str_id] = mapped_column(primary_key=True, default=lambda: uuid4().hex[-12:], comment='主键')
 
 
+def trigram_index(name: str, *columns: str, where=None) -> Index:
+    """
+    关键字模糊查询（LIKE/ILIKE '%关键字%'、相似度查询）使用的pg_trgm GIN索引，
+    所需的pg_trgm扩展记录在metadata.info中，由迁移脚本创建
+    Args:
+        name: 索引名称
+        columns: 列名称
+        where: 部分索引的条件，只索引满足条件的行（需要与查询中的条件一致才会使用）
+
+    Returns:
+        Index
+    """
+    OLTPModelBase.metadata.info.setdefault('extensions', set()).add('pg_trgm')
+    return Index(
+        name,
+        *columns,
+        postgresql_using='gin',
+        postgresql_ops={column: 'gin_trgm_ops' for column in columns},
+        postgresql_where=where,
+    )
+
+
 class OLAPModelBase(DeclarativeBase, ModelTemplate):
     """
     OLAP模型基类
@@ -11,6 +11,8 @@ import string
 from werkzeug.security import check_password_hash
 from werkzeug.security import generate_password_hash
 
+from config import PASSWORD_HASH_METHOD
+from config import PASSWORD_HASH_SALT_LENGTH
 from .base import *
 from ..enums import *
 
@@ -20,6 +22,11 @@ class User(OLTPModelBase, TimeColumns):
     用户信息
     """
     __tablename__ = 'user'
+    __table_args__ = (
+        # 用户列表只查询有效用户，按账号/用户名模糊查询
+        trigram_index('ix_user_account_trgm', 'account', where=text('valid')),
+        trigram_index('ix_user_username_trgm', 'username', where=text('valid')),
+    )
     role: Mapped[RoleEnum] = mapped_column(comment='角色')
     email: Mapped[str_medium] = mapped_column(comment='邮箱')
     phone: Mapped[str_small] = mapped_column(comment='手机')
@@ -30,10 +37,22 @@ class User(OLTPModelBase, TimeColumns):
 
     @staticmethod
     def generate_hash(raw_password):
-        return generate_password_hash(raw_password)
+        return generate_password_hash(raw_password, PASSWORD_HASH_METHOD, PASSWORD_HASH_SALT_LENGTH)
+
+    @staticmethod
+    def verify_hash(password_hash, raw_password):
+        return check_password_hash(password_hash, raw_password)
 
     def check_password(self, raw_password):
-        return check_password_hash(self.password, raw_password) or self.password == raw_password
+        return self.verify_hash(self.password, raw_password)
+
+    def need_rehash(self):
+        """
+        密码哈希的参数和当前配置不一致时需要重新哈希
+        """
+        method, _, remain = (self.password or '').partition('$')
+        salt = remain.partition('$')[0]
+        return method != PASSWORD_HASH_METHOD or len(salt) != PASSWORD_HASH_SALT_LENGTH
 
     @staticmethod
     def valid_password(password):
@@ -0,0 +1,120 @@
+"""
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+File Name   : resources.py
+Author      : jinming.yang
+Description : 数据库、缓存等连接资源的注册表
+资源在首次使用时才创建，并且按进程区分：fork出的子进程会重新创建自己的连接，不会和父进程共用socket
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+"""
+import os
+import threading
+from typing import Callable
+
+
+class Resources:
+    """
+    连接资源注册表
+    """
+    _factories = {}  # {名称: (创建函数, 关闭函数, fork后子进程丢弃继承的实例时的处理函数)}
+    _instances = {}  # {名称: (创建时的PID, 实例)}
+    _lock = threading.RLock()
+
+    @classmethod
+    def register(cls, name: str, factory: Callable, closer: Callable = None, after_fork: Callable = None):
+        """
+        注册资源
+        Args:
+            name: 资源名称
+            factory: 创建资源的函数
+            closer: 关闭资源的函数
+            after_fork: 子进程丢弃从父进程继承的实例时的处理（不能关闭父进程仍在使用的连接）
+
+        Returns:
+            资源的代理对象，访问其属性时才创建资源
+        """
+        cls._factories[name] = (factory, closer, after_fork)
+        return ResourceProxy(name)
+
+    @classmethod
+    def get(cls, name: str):
+        """
+        获取当前进程的资源实例（不存在则创建）
+        """
+        pid = os.getpid()
+        instance = cls._instances.get(name)
+        if instance is None or instance[0] != pid:
+            with cls._lock:
+                instance = cls._instances.get(name)
+                if instance is None or instance[0] != pid:
+                    factory, _, after_fork = cls._factories[name]
+                    if instance is not None and after_fork:
+                        after_fork(instance[1])
+                    instance = (pid, factory())
+                    cls._instances[name] = instance
+        return instance[1]
+
+    @classmethod
+    def init(cls, *names):
+        """
+        预先创建资源（默认全部），用于需要在启动时就确认资源可用的场景
+        """
+        for name in names or list(cls._factories):
+            cls.get(name)
+
+    @classmethod
+    def close(cls, *names):
+        """
+        关闭当前进程创建的资源（默认全部），再次使用时会重新创建
+        """
+        pid = os.getpid()
+        with cls._lock:
+            for name in names or list(cls._instances):
+                instance = cls._instances.pop(name, None)
+                if instance is None:
+                    continue
+                _, closer, after_fork = cls._factories[name]
+                if instance[0] == pid:
+                    if closer:
+                        closer(instance[1])
+                elif after_fork:
+                    after_fork(instance[1])
+
+    @classmethod
+    def created(cls, name: str) -> bool:
+        """
+        当前进程是否已经创建了该资源
+        """
+        instance = cls._instances.get(name)
+        return instance is not None and instance[0] == os.getpid()
+
+
+class ResourceProxy:
+    """
+    资源的代理：属性访问转发给当前进程的资源实例
+    """
+    __slots__ = ('_name',)
+
+    def __init__(self, name: str):
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, item):
+        return getattr(Resources.get(self._name), item)
+
+    def __setattr__(self, key, value):
+        setattr(Resources.get(self._name), key, value)
+
+    def __eq__(self, other):
+        # 与实例本身相等，SQLAlchemy以引擎为键记录Session的连接，绑定代理的Session才能复用同一个连接
+        if isinstance(other, ResourceProxy):
+            other = Resources.get(other._name)
+        return Resources.get(self._name) == other
+
+    def __hash__(self):
+        return hash(Resources.get(self._name))
+
+    def __repr__(self):
+        state = repr(Resources.get(self._name)) if Resources.created(self._name) else '未创建'
+        return f'<ResourceProxy {self._name}: {state}>'
+
+
+__all__ = ['Resources', 'ResourceProxy']
@@ -11,10 +11,26 @@ CREATE TABLE IF NOT EXISTS api_request_logs
     `source_ip`  IPv4,
 
     INDEX arl_duration_index duration TYPE minmax GRANULARITY 2,
-    INDEX arl_status_code_index status TYPE minmax GRANULARITY 4
+    INDEX arl_status_code_index status TYPE minmax GRANULARITY 4,
+    INDEX arl_method_index method TYPE set(16) GRANULARITY 4,
+    INDEX arl_source_ip_index source_ip TYPE minmax GRANULARITY 4,
+
+    -- 不按用户筛选时（默认的按时间倒序、按状态码筛选）排序键以user_id开头无法跳过数据，由投影按时间读取
+    -- 投影只包含列表查询的列（不含id），采样查询（SAMPLE）不使用投影，仍然读取原表
+    PROJECTION arl_created_at_projection
+    (
+        SELECT user_id, created_at, method, blueprint, uri, status, duration, source_ip
+        ORDER BY created_at
+    ),
+    PROJECTION arl_status_projection
+    (
+        SELECT user_id, created_at, method, blueprint, uri, status, duration, source_ip
+        ORDER BY (status, created_at)
+    )
 ) ENGINE = MergeTree
       PARTITION BY toYYYYMMDD(created_at)
-      ORDER BY (user_id, created_at, id)
+      ORDER BY (user_id, toStartOfHour(created_at), cityHash64(id))
+      SAMPLE BY cityHash64(id)
       TTL toDateTime(created_at) + toIntervalDay(180)
       SETTINGS index_granularity = 1024;
 
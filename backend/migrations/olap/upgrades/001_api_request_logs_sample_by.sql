@@ -0,0 +1,64 @@
+-- api_request_logs增加采样键：SAMPLE BY必须包含在排序键中，而排序键无法通过ALTER修改，需要重建表
+-- 采样键前面的时间按小时取整，否则每个用户的数据按秒级时间排序，采样键几乎不起作用，SAMPLE仍需读取几乎全部数据
+-- 已按旧排序键(user_id, created_at, ...)执行过本文件的环境可以重新执行本文件，之后需要重新执行002、003、004
+-- 重建期间停止物化视图写入（消息保留在Kafka中，视图重建后按消费组位点继续消费）
+DROP VIEW IF EXISTS ApiRequestLogs;
+
+
+CREATE TABLE IF NOT EXISTS api_request_logs_sampled
+(
+    `id`         UUID,
+    `user_id` LowCardinality(String),
+    `created_at` DateTime64(3),
+    `method` LowCardinality(String),
+    `blueprint` LowCardinality(String),
+    `uri` LowCardinality(String),
+    `status`     Int32,
+    `duration`   Int32,
+    `source_ip`  IPv4,
+
+    INDEX arl_duration_index duration TYPE minmax GRANULARITY 2,
+    INDEX arl_status_code_index status TYPE minmax GRANULARITY 4
+) ENGINE = MergeTree
+      PARTITION BY toYYYYMMDD(created_at)
+      ORDER BY (user_id, toStartOfHour(created_at), cityHash64(id))
+      SAMPLE BY cityHash64(id)
+      TTL toDateTime(created_at) + toIntervalDay(180)
+      SETTINGS index_granularity = 1024;
+
+
+INSERT INTO api_request_logs_sampled
+SELECT *
+FROM api_request_logs;
+
+
+EXCHANGE TABLES api_request_logs AND api_request_logs_sampled;
+
+
+DROP TABLE IF EXISTS api_request_logs_sampled;
+
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS ApiRequestLogs
+            TO api_request_logs
+            (
+             `id` UUID,
+             `user_id` LowCardinality(String),
+             `created_at` DateTime,
+             `method` LowCardinality(String),
+             `blueprint` LowCardinality(String),
+             `uri` LowCardinality(String),
+             `status` Int32,
+             `duration` Int32,
+             `source_ip` IPv4
+                )
+AS
+SELECT id,
+       user_id,
+       toDateTime(created_at) AS created_at,
+       method,
+       blueprint,
+       uri,
+       status,
+       duration,
+       toIPv4(source_ip)      AS source_ip
+FROM api_request_logs_queue;
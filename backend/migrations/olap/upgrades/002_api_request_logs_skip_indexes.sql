@@ -0,0 +1,8 @@
+-- api_request_logs增加method的跳数索引
+ALTER TABLE api_request_logs
+    ADD INDEX IF NOT EXISTS arl_method_index method TYPE set(16) GRANULARITY 4;
+
+
+-- 新写入的数据自动生成索引，已有数据通过后台mutation生成（进度见system.mutations），期间查询不受影响
+ALTER TABLE api_request_logs
+    MATERIALIZE INDEX arl_method_index;
@@ -0,0 +1,8 @@
+-- api_request_logs增加source_ip的minmax索引：IP条件转为IPv4的数值范围后可以跳过不在范围内的数据块
+ALTER TABLE api_request_logs
+    ADD INDEX IF NOT EXISTS arl_source_ip_index source_ip TYPE minmax GRANULARITY 4;
+
+
+-- 已有数据通过后台mutation生成索引（进度见system.mutations）
+ALTER TABLE api_request_logs
+    MATERIALIZE INDEX arl_source_ip_index;
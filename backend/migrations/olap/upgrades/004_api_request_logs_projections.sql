@@ -0,0 +1,42 @@
+-- api_request_logs增加按时间、按(状态码, 时间)排序的投影：排序键以user_id开头，不按用户筛选的列表查询由投影按时间读取
+-- 投影只包含列表查询的列（不含id），采样查询（SAMPLE）不使用投影，仍然读取原表
+-- 删除get_logs不会使用的blueprint、uri跳数索引，以及之前版本包含全部列（SELECT *）的同名投影
+ALTER TABLE api_request_logs
+    DROP INDEX IF EXISTS arl_blueprint_index;
+
+
+ALTER TABLE api_request_logs
+    DROP INDEX IF EXISTS arl_uri_index;
+
+
+ALTER TABLE api_request_logs
+    DROP PROJECTION IF EXISTS arl_created_at_projection;
+
+
+ALTER TABLE api_request_logs
+    DROP PROJECTION IF EXISTS arl_status_projection;
+
+
+ALTER TABLE api_request_logs
+    ADD PROJECTION arl_created_at_projection
+    (
+        SELECT user_id, created_at, method, blueprint, uri, status, duration, source_ip
+        ORDER BY created_at
+    );
+
+
+ALTER TABLE api_request_logs
+    ADD PROJECTION arl_status_projection
+    (
+        SELECT user_id, created_at, method, blueprint, uri, status, duration, source_ip
+        ORDER BY (status, created_at)
+    );
+
+
+-- 新写入的数据自动生成投影，已有数据通过后台mutation生成（进度见system.mutations），生成完成前查询仍然读取原表
+ALTER TABLE api_request_logs
+    MATERIALIZE PROJECTION arl_created_at_projection;
+
+
+ALTER TABLE api_request_logs
+    MATERIALIZE PROJECTION arl_status_projection;
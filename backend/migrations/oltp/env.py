@@ -3,6 +3,7 @@ from logging.config import fileConfig
 from alembic import context
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy import text
 
 from config import DATABASE_OLTP_URI
 from defines import OLTPModelBase
@@ -19,6 +20,13 @@ config.set_main_option(
 target_metadata = OLTPModelBase.metadata
 
 
+def create_extensions() -> None:
+    # model中声明的索引依赖的扩展（例如trigram_index需要pg_trgm），需要在迁移前创建
+    if context.get_context().dialect.name == 'postgresql':
+        for name in sorted(target_metadata.info.get('extensions', ())):
+            context.execute(text(f'CREATE EXTENSION IF NOT EXISTS {name}'))
+
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -29,6 +37,7 @@ def run_migrations_offline() -> None:
     )
 
     with context.begin_transaction():
+        create_extensions()
         context.run_migrations()
 
 
@@ -45,6 +54,7 @@ def run_migrations_online() -> None:
         )
 
         with context.begin_transaction():
+            create_extensions()
             context.run_migrations()
 
 
@@ -6,14 +6,17 @@ Description : 程序的入口位置，通过该文件启动app程序
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 """
 import asyncio
+import atexit
 
 from flask import Flask
 from flask_cors import CORS  # 解决前后端联调的跨域问题
 from flask_jwt_extended import JWTManager
 from flask_jwt_extended import get_jwt_identity
 from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
 from hypercorn.asyncio import serve
 from hypercorn.config import Config
+from jwt.exceptions import PyJWTError
 from werkzeug.exceptions import MethodNotAllowed
 from werkzeug.exceptions import NotFound
 
@@ -37,6 +40,8 @@ def create_app():
         # 注册蓝图，只要在apis的__init__.py中导入了即可
         flask_app.register_blueprint(bp)
     register_handler(flask_app)  # 注册错误处理函数
+    # 数据库等连接在首次使用时才创建（且按进程区分），进程退出时统一关闭
+    atexit.register(Resources.close)
     return flask_app
 
 
@@ -58,9 +63,9 @@ def register_handler(flask_app):
             None
         """
         request.started_at = time()
+        request.uid = None
         # 1.无需鉴权的接口直接返回
         if SKIP_AUTH_REGEX.match(request.path):
-            request.uid = None
             return None
         # 2.对接口进行鉴权
         try:
@@ -68,18 +73,22 @@ def register_handler(flask_app):
             if (uid := get_jwt_identity()) is None:
                 return response(403, msg='未授权进行该操作')
             request.uid = uid
+        except (JWTExtendedException, PyJWTError) as ex:
+            # 无效、过期的令牌属于正常情况，不需要记录堆栈
+            logger.debug('认证失效：{}', ex)
+            return response(401, msg='认证失效')
         except Exception as ex:
             logger.exception(ex)
             return response(401, msg='认证失效')
 
     @flask_app.errorhandler(NotFound)
     def handle_path_error(_):
-        logger.debug(f'未定义的地址：{request.base_url}')
+        logger.opt(lazy=True).debug('未定义的地址：{}', lambda: request.base_url)
         return response(404, msg='请求地址错误')
 
     @flask_app.errorhandler(MethodNotAllowed)
     def handle_method_error(_):
-        logger.debug(f'未定义的地址：{request.base_url}，方法：{request.method}')
+        logger.opt(lazy=True).debug('未定义的地址：{}，方法：{}', lambda: request.base_url, lambda: request.method)
         return response(404, msg='请求方法错误')
 
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试从仓库根目录或backend目录运行时都可以直接导入backend下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
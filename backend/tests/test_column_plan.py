@@ -0,0 +1,87 @@
+"""
+ColumnPlan生成的json()与逐列遍历mapper的结果一致
+"""
+from datetime import datetime
+from ipaddress import IPv4Address
+
+import pytest
+from sqlalchemy import DateTime
+from sqlalchemy import JSON
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.properties import ColumnProperty
+
+from defines import ApiRequestLogs
+from defines import OLTPModelBase
+from defines import RoleEnum
+from defines import User
+
+
+def reference_json(model, obj, excluded=None):
+    """
+    按mapper逐列生成dict（ColumnPlan之前json()的实现）
+    """
+    result = {}
+    for prop in model.__mapper__.iterate_properties:
+        if not isinstance(prop, ColumnProperty):
+            continue
+        if prop.key.startswith('_') or prop.key in (excluded or set()):
+            continue
+        value = getattr(obj, prop.key)
+        if isinstance(prop.columns[0].type, JSON):
+            result[prop.key] = value if value else None
+        elif isinstance(prop.columns[0].type, DateTime):
+            result[prop.key] = value if value else '-'
+        else:
+            result[prop.key] = value
+    return result
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "plan.db"}')
+    OLTPModelBase.metadata.create_all(engine, tables=[User.__table__])
+    with Session(engine) as session:
+        session.add(User(account='a', username='u', email='e', phone='p', password='x', role=RoleEnum.User))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize('excluded', [None, {'password'}, {'password', 'created_at', 'missing'}])
+def test_loaded_instance(session, excluded):
+    user = session.scalar(select(User))
+    assert user.json(excluded) == reference_json(User, user, excluded)
+    assert list(user.json(excluded)) == list(reference_json(User, user, excluded))
+
+
+def test_expired_instance(session):
+    user = session.scalar(select(User))
+    session.expire(user, ['email'])
+    expected = reference_json(User, user)
+    session.expire(user, ['email'])
+    assert user.json() == expected
+
+
+def test_record(session):
+    user = session.scalar(select(User))
+    record_cls = User.record_class()
+    row = session.execute(select(*User.to_property(record_cls.fields))).first()
+    record = record_cls.make(row)
+    assert record.json() == user.json()
+    assert record.json({'password'}) == reference_json(User, user, {'password'})
+
+
+def test_transient_instance():
+    user = User(account='a', role=RoleEnum.Admin)
+    assert user.json() == reference_json(User, user)
+    assert user.json()['updated_at'] == '-'
+
+
+def test_olap_model():
+    log = ApiRequestLogs(
+        id='1', user_id='u', created_at=datetime(2026, 1, 1), method='GET', blueprint='system', uri='/logs',
+        status=200, duration=5, source_ip=IPv4Address('10.0.0.1'),
+    )
+    assert log.json() == reference_json(ApiRequestLogs, log)
@@ -0,0 +1,64 @@
+"""
+关键字包含查询的匹配模式：关键字中的通配符按普通字符匹配
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from apis.common import contains_pattern
+from defines import ApiRequestLogs
+from defines import OLTPModelBase
+from defines import User
+from defines import compile_olap
+
+ACCOUNTS = ['acc_1', 'ACC_10', 'accX1', 'a%b', 'aXb', 'c\\d', 'cd']
+
+
+@pytest.mark.parametrize('keyword, pattern', [
+    ('abc', '%abc%'),
+    ('a_b', '%a\\_b%'),
+    ('50%', '%50\\%%'),
+    ('c\\d', '%c\\\\d%'),
+    ('', '%%'),
+])
+def test_pattern(keyword, pattern):
+    assert contains_pattern(keyword) == pattern
+
+
+@pytest.fixture(scope='module')
+def session(tmp_path_factory):
+    engine = create_engine(f'sqlite:///{tmp_path_factory.mktemp("db") / "pattern.db"}')
+    OLTPModelBase.metadata.create_all(engine, tables=[User.__table__])
+    with Session(engine) as session:
+        session.add_all(
+            User(account=account, username=account, email='', phone='', password='', role='User')
+            for account in ACCOUNTS
+        )
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize('keyword, expected', [
+    ('acc_1', {'acc_1', 'ACC_10'}),
+    ('a%b', {'a%b'}),
+    ('c\\d', {'c\\d'}),
+    ('X', {'accX1', 'aXb'}),
+])
+def test_ilike_matches_literally(session, keyword, expected):
+    sql = select(User.account).where(User.account.ilike(contains_pattern(keyword), escape='\\'))
+    assert set(session.scalars(sql)) == expected
+
+
+def test_olap_omits_escape():
+    # ClickHouse的LIKE固定以反斜杠转义，不支持ESCAPE子句；字符串中的反斜杠本身也需要转义
+    condition = ApiRequestLogs.uri.ilike(contains_pattern('a_b'), escape='\\')
+    sql = compile_olap(select(ApiRequestLogs.id).where(condition))
+    assert "LIKE lower('%a\\\\_b%')" in sql
+    assert 'ESCAPE' not in sql
+
+
+def test_olap_escapes_backslash_in_literals():
+    sql = compile_olap(select(ApiRequestLogs.id).where(ApiRequestLogs.uri == "a\\' OR 1=1"))
+    assert sql.endswith("= 'a\\\\'' OR 1=1'")
@@ -0,0 +1,79 @@
+"""
+DataLoader：登记的ID在首次取值时合并为一次IN查询
+"""
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import apis.common
+from apis.common import DataLoader
+from defines import OLTPModelBase
+from defines import RoleEnum
+from defines import User
+from utils import execute_sql
+
+
+@pytest.fixture
+def queries(tmp_path, monkeypatch):
+    """
+    使用SQLite执行DataLoader的查询，返回执行过的SQL列表
+    """
+    engine = create_engine(f'sqlite:///{tmp_path / "loader.db"}')
+    OLTPModelBase.metadata.create_all(engine, tables=[User.__table__])
+    with Session(engine) as session:
+        session.add_all(
+            User(id=f'u{i}', account=f'a{i}', username=f'n{i}', email='', phone='', password='', role=RoleEnum.User)
+            for i in range(5)
+        )
+        session.commit()
+    executed = []
+
+    def execute(sql, **kwargs):
+        executed.append(sql)
+        with Session(engine) as session:
+            return execute_sql(sql, session=session, **kwargs)
+
+    monkeypatch.setattr(apis.common, 'execute_sql', execute)
+    yield executed
+    engine.dispose()
+
+
+def test_batches_into_one_query(queries):
+    loader = DataLoader(User)
+    rows = ['u1', 'u2', 'u1', 'missing', None, 'u3']
+    values = [loader.load(key, 'account', '') for key in rows]
+    assert queries == []
+    assert [value.get() for value in values] == ['a1', 'a2', 'a1', '', '', 'a3']
+    assert len(queries) == 1
+    assert set(queries[0].compile().params['id_1']) == {'u1', 'u2', 'u3', 'missing'}
+
+
+def test_cached_keys_are_not_queried_again(queries):
+    loader = DataLoader(User)
+    loader.load('u1').get()
+    assert loader.load('u1', 'username').get() == 'n1'
+    assert loader.get('missing') is None
+    assert loader.get('missing') is None
+    assert len(queries) == 2
+    assert loader.load('u4', 'username').get() == 'n4'
+    assert len(queries) == 3
+
+
+def test_prime(queries):
+    loader = DataLoader(User)
+    loader.prime([User(id='u9', account='primed')])
+    assert loader.load('u9', 'account').get() == 'primed'
+    assert queries == []
+
+
+def test_shared_within_request():
+    app = Flask(__name__)
+    with app.test_request_context():
+        assert DataLoader.of(User) is DataLoader.of(User)
+        assert DataLoader.of(User) is not DataLoader.of(User, User.account)
+    with app.test_request_context():
+        first = DataLoader.of(User)
+    with app.test_request_context():
+        assert DataLoader.of(User) is not first
+    assert DataLoader.of(User) is not DataLoader.of(User)
@@ -0,0 +1,37 @@
+"""
+IP查询条件的解析
+"""
+from ipaddress import IPv4Address
+
+import pytest
+
+from apis.common import ip_bounds
+
+
+@pytest.mark.parametrize('value, start, end', [
+    ('10.0.0.1', '10.0.0.1', '10.0.0.1'),
+    (' 10.0.0.1 ', '10.0.0.1', '10.0.0.1'),
+    ('10.0.0.0/24', '10.0.0.0', '10.0.0.255'),
+    ('10.0.0.7/24', '10.0.0.0', '10.0.0.255'),
+    ('10.0.0.1-10.0.0.50', '10.0.0.1', '10.0.0.50'),
+    ('10.0.0.1 - 10.0.0.1', '10.0.0.1', '10.0.0.1'),
+    ('10.', '10.0.0.0', '10.255.255.255'),
+    ('10.0.', '10.0.0.0', '10.0.255.255'),
+    ('10.0.*', '10.0.0.0', '10.0.255.255'),
+    ('192.168.1.*', '192.168.1.0', '192.168.1.255'),
+])
+def test_valid(value, start, end):
+    assert ip_bounds(value) == (IPv4Address(start), IPv4Address(end))
+
+
+@pytest.mark.parametrize('value', [
+    '10.0.0.50-10.0.0.1',
+    '10.0.0.256',
+    '10.0.0.0/33',
+    '10.0.x.',
+    'abc',
+    '',
+])
+def test_invalid(value):
+    with pytest.raises(ValueError):
+        ip_bounds(value)
@@ -0,0 +1,128 @@
+"""
+KafkaWorker的批次处理：使用模拟的消费者验证rebalance期间的行为
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import confluent_kafka
+import pytest
+
+from utils.classes import KafkaWorker
+from utils.classes import _ConsumerState
+
+
+class FakeMessage:
+    def __init__(self, topic, partition, offset, value=None):
+        self._topic, self._partition, self._offset = topic, partition, offset
+        self._value = json.dumps(value if value is not None else offset).encode()
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    def __init__(self, state, polled=(), revoke=None, commit_error=False):
+        self.state = state
+        self.polled = list(polled)
+        self.revoke = revoke
+        self.commit_error = commit_error
+        self.committed = []
+        self.paused = []
+        self.seeks = []
+
+    def assignment(self):
+        return []
+
+    def pause(self, partitions):
+        self.paused.extend(partitions)
+
+    def resume(self, _):
+        pass
+
+    def assign(self, _):
+        pass
+
+    def poll(self, _):
+        if self.revoke:
+            self.state.on_revoke(self, [confluent_kafka.TopicPartition(*self.revoke)])
+            self.revoke = None
+        return self.polled.pop(0) if self.polled else None
+
+    def seek(self, tp):
+        self.seeks.append((tp.topic, tp.partition, tp.offset))
+
+    def commit(self, offsets, asynchronous):
+        if self.commit_error:
+            error = confluent_kafka.KafkaError(confluent_kafka.KafkaError.REBALANCE_IN_PROGRESS)
+            raise confluent_kafka.KafkaException(error)
+        self.committed.extend((tp.topic, tp.partition, tp.offset) for tp in offsets)
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    handled = []
+
+    def handle(messages):
+        time.sleep(1.2)  # 处理期间会调用poll
+        handled.extend(messages)
+
+    monkeypatch.setitem(KafkaWorker._handlers, 'T', handle)
+    worker = KafkaWorker(consumers=1, threads=2)
+    worker._executor = ThreadPoolExecutor(2)
+    worker.handled = handled
+    yield worker
+    worker._executor.shutdown()
+
+
+def test_polled_message_is_buffered(worker):
+    state = _ConsumerState()
+    late = FakeMessage('T', 1, 0)
+    consumer = FakeConsumer(state, polled=[late])
+    worker._process(consumer, [FakeMessage('T', 0, 5)], state)
+    assert consumer.committed == [('T', 0, 6)]
+    assert state.take() == [late]
+
+
+def test_revoked_partition_is_not_committed(worker):
+    state = _ConsumerState()
+    consumer = FakeConsumer(state, polled=[FakeMessage('T', 1, 3)], revoke=('T', 1))
+    worker._process(consumer, [FakeMessage('T', 0, 5), FakeMessage('T', 1, 2)], state)
+    assert consumer.committed == [('T', 0, 6)]
+    assert state.take() == []
+
+
+def test_commit_error_keeps_worker_running(worker):
+    state = _ConsumerState()
+    consumer = FakeConsumer(state, commit_error=True)
+    worker._process(consumer, [FakeMessage('T', 0, 5)], state)
+    assert not worker._stop.is_set()
+
+
+def test_failure_discards_buffered_later_offsets(worker, monkeypatch):
+    def handle(messages):
+        time.sleep(2.2)  # 处理期间调用两次poll
+        if 5 in messages:
+            raise ValueError('处理失败')
+
+    monkeypatch.setitem(KafkaWorker._handlers, 'T', handle)
+    state = _ConsumerState()
+    other = FakeMessage('T', 1, 0)
+    consumer = FakeConsumer(state, polled=[FakeMessage('T', 0, 6), other])
+    worker._process(consumer, [FakeMessage('T', 0, 5)], state)
+    # 失败分区回退到批次开头，之后的消息不能先于失败的消息处理及提交
+    assert consumer.seeks == [('T', 0, 5)]
+    assert consumer.committed == []
+    assert state.take() == [other]
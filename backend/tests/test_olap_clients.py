@@ -0,0 +1,57 @@
+"""
+OLAP客户端池：请求首次查询OLAP时才获取客户端，并发查询设置的超时只对本次查询生效
+"""
+import defines.models.base
+from defines.models.base import OLAPClientPool
+from utils.functions import _QueryTask
+
+
+class FakeConnection:
+    def send_cancel(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.settings = {}
+        self.connection = FakeConnection()
+        self.disconnected = False
+
+    def execute(self, sql):
+        return sql
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+def test_lazy_client(monkeypatch):
+    created = []
+    monkeypatch.setattr(defines.models.base, 'olap_client', lambda url: created.append(FakeClient()) or created[-1])
+    pool = OLAPClientPool(1)
+    unused = pool.lazy()
+    unused.release()
+    assert created == []
+    lazy = pool.lazy()
+    assert lazy.execute('SELECT 1') == 'SELECT 1'
+    lazy.execute('SELECT 2')
+    assert len(created) == 1
+    lazy.release()
+    assert pool.acquire() is created[0]
+
+
+def test_release_disconnects_when_full():
+    pool = OLAPClientPool(1)
+    first, second = FakeClient(), FakeClient()
+    pool.release(first)
+    pool.release(second)
+    assert not first.disconnected and second.disconnected
+
+
+def test_task_timeout_is_cleared_after_query():
+    client = FakeClient()
+    client.settings['other'] = 1
+    task = _QueryTask('SELECT 1', {'session': client}, 2.5)
+    task.bind(client)
+    assert client.settings['max_execution_time'] == 3
+    task.unbind()
+    assert client.settings == {'other': 1}
@@ -0,0 +1,67 @@
+"""
+OLTP读写分离：用SQLite文件代替主库和只读副本，不需要启动数据库
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import text
+
+import defines.models.base as base
+from defines import *
+from utils import execute_sql
+
+
+def _account():
+    return execute_sql(select(User.account).order_by(User.account))
+
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    """
+    主库和两个副本各有一个以库名为账号的用户，通过查询到的账号判断查询走了哪个库
+    """
+    uris = {name: f'sqlite:///{tmp_path / name}.db' for name in ('primary', 'r1', 'r2')}
+    for name, uri in uris.items():
+        engine = create_engine(uri)
+        User.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(User).values(id=name, account=name, username=name, role=RoleEnum.User, email='',
+                                             phone='', password='', valid=True))
+        engine.dispose()
+    monkeypatch.setattr(base, 'DATABASE_OLTP_URI', uris['primary'])
+    monkeypatch.setattr(base, 'DATABASE_OLTP_REPLICA_URIS', [uris['r1'], uris['r2']])
+    Resources.close('oltp', 'oltp_router')
+    yield uris
+    Resources.close('oltp', 'oltp_router')
+
+
+def test_reads_use_replicas(databases):
+    assert {_account() for _ in range(4)} == {'r1', 'r2'}
+
+
+def test_failed_replica_falls_back_to_primary(databases):
+    replica = OLTPRouter.replicas[0]
+    with replica.engine.begin() as conn:
+        conn.execute(text('DROP TABLE user'))
+    results = [_account() for _ in range(4)]
+    # 副本查询失败时本次查询回退到主库，之后不再使用该副本
+    assert 'r1' not in results
+    assert 'primary' in results
+    assert not replica.available
+    assert results[-1] == 'r2'
+
+
+def test_read_your_writes_pins_primary(databases):
+    tokens = set_read_your_writes(True)
+    try:
+        assert _account() in ('r1', 'r2')
+        execute_sql(insert(User).values(id='new', account='0-new', username='', role=RoleEnum.User, email='',
+                                        phone='', password='', valid=True))
+        # 写入后的查询固定走主库，能读到刚写入的数据
+        assert _account() == '0-new'
+        assert _account() == '0-new'
+    finally:
+        reset_read_your_writes(tokens)
+    assert _account() in ('r1', 'r2')
+
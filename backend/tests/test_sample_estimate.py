@@ -0,0 +1,41 @@
+"""
+采样查询的总数估算
+"""
+import math
+import random
+
+import pytest
+
+from apis.common import sample_estimate
+
+
+@pytest.mark.parametrize('rate', [None, 0, 1, 1.5])
+def test_without_sampling(rate):
+    assert sample_estimate(123, rate) == (123, None)
+
+
+def test_estimate():
+    total, info = sample_estimate(1000, 0.1)
+    assert total == 10000
+    assert info == {'rate': 0.1, 'confidence': 0.95, 'error': round(1.96 * math.sqrt(1000 * 0.9) / 0.1)}
+
+
+def test_empty_sample():
+    assert sample_estimate(0, 0.01) == (0, {'rate': 0.01, 'confidence': 0.95, 'error': 0})
+
+
+def test_error_shrinks_with_rate():
+    # 同样的全量数据，采样比例越大误差越小
+    errors = [sample_estimate(round(100000 * rate), rate)[1]['error'] for rate in (0.01, 0.1, 0.5)]
+    assert errors == sorted(errors, reverse=True)
+
+
+def test_interval_covers_true_total():
+    # 固定种子的伯努利抽样：95%置信区间应覆盖绝大多数情况下的真实总数
+    rng = random.Random(0)
+    covered = 0
+    for _ in range(200):
+        count = sum(rng.random() < 0.05 for _ in range(5000))
+        total, info = sample_estimate(count, 0.05)
+        covered += abs(total - 5000) <= info['error']
+    assert covered >= 180
@@ -0,0 +1,102 @@
+"""
+SingleFlight的跨进程合并：使用模拟的Redis验证等待者只读取当前这次执行的结果
+"""
+import json
+
+import pytest
+import redis
+
+import utils.classes
+from utils.classes import SingleFlight
+
+
+class FakeLock:
+    def __init__(self, store, name):
+        self.store, self.name = store, name
+
+    def acquire(self, token):
+        if self.name in self.store.data:
+            return False
+        self.store.data[self.name] = token
+        return True
+
+    def release(self):
+        self.store.data.pop(self.name, None)
+
+
+class FakeRedis:
+    def __init__(self, data=None, on_get=None):
+        self.data = dict(data or {})
+        self.on_get = on_get  # 每次get时调用，模拟其他进程中的执行者
+
+    def lock(self, name, **_):
+        return FakeLock(self, name)
+
+    def get(self, name):
+        if self.on_get:
+            self.on_get(self)
+        return self.data.get(name)
+
+    def set(self, name, value, **_):
+        self.data[name] = value
+
+
+@pytest.fixture
+def flight(monkeypatch):
+    monkeypatch.setattr(utils.classes, 'COALESCE_POLL_INTERVAL', 0)
+    monkeypatch.setattr(utils.classes, 'COALESCE_TIMEOUT', 1)
+    return SingleFlight()
+
+
+def test_leader_stores_result_by_token(flight, monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(utils.classes, 'Redis', fake)
+    assert flight._do_remote('g', 'k', lambda: {'value': 1}) == {'value': 1}
+    assert 'coalesce:lock:k' not in fake.data
+    [(name, value)] = fake.data.items()
+    assert name.startswith('coalesce:result:k:') and json.loads(value) == {'value': 1}
+
+
+def on_call(n, action):
+    """
+    第n次调用时执行action
+    """
+    calls = []
+
+    def hook(store):
+        calls.append(None)
+        if len(calls) == n:
+            action(store)
+
+    return hook
+
+
+def test_follower_reads_current_execution(flight, monkeypatch):
+    def finish(store):
+        store.data['coalesce:result:k:current'] = json.dumps('fresh')
+        store.data.pop('coalesce:lock:k')
+
+    fake = FakeRedis(
+        {'coalesce:lock:k': 'current', 'coalesce:result:k:previous': json.dumps('stale')},
+        on_call(3, finish),
+    )
+    monkeypatch.setattr(utils.classes, 'Redis', fake)
+    assert flight._do_remote('g', 'k', lambda: 'local') == 'fresh'
+
+
+def test_follower_ignores_stale_result(flight, monkeypatch):
+    # 当前这次执行失败（锁释放但没有结果），残留的之前的结果不能被共享
+    fake = FakeRedis(
+        {'coalesce:lock:k': 'current', 'coalesce:result:k:previous': json.dumps('stale')},
+        on_call(3, lambda store: store.data.pop('coalesce:lock:k')),
+    )
+    monkeypatch.setattr(utils.classes, 'Redis', fake)
+    assert flight._do_remote('g', 'k', lambda: 'local') == 'local'
+
+
+def test_redis_error_while_polling_runs_locally(flight, monkeypatch):
+    def fail(_):
+        raise redis.ConnectionError('down')
+
+    monkeypatch.setattr(utils.classes, 'Redis', FakeRedis({'coalesce:lock:k': 'current'}, on_call(2, fail)))
+    assert flight._do_remote('g', 'k', lambda: 'local') == 'local'
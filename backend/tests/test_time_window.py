@@ -0,0 +1,86 @@
+"""
+OLAP列表查询的时间范围：默认范围、角色的最大范围及PREWHERE输出
+"""
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+import apis.common
+from apis.common import APIErrorResponse
+from apis.common import sample_condition
+from apis.common import time_window
+from defines import ApiRequestLogs
+from defines import RoleEnum
+from defines import compile_olap
+
+NOW = datetime(2026, 1, 31, 12)
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(apis.common, 'OLAP_DEFAULT_WINDOW_DAYS', 1)
+    monkeypatch.setattr(apis.common, 'OLAP_MAX_WINDOW', {'Admin': 180, '*': 31})
+
+
+def query(params, role=None):
+    sql = select(ApiRequestLogs.id)
+    return compile_olap(time_window(sql, params, ApiRequestLogs.created_at, role))
+
+
+def test_default_window(monkeypatch):
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return NOW
+
+    monkeypatch.setattr(apis.common, 'datetime', FixedDatetime)
+    # 默认从当天0点开始，只涉及当天的分区
+    assert query({}).endswith("PREWHERE api_request_logs.created_at >= '2026-01-31 00:00:00'")
+
+
+def test_default_window_before_end():
+    sql = query({'created_at_end': NOW})
+    assert "BETWEEN '2026-01-31 00:00:00' AND '2026-01-31 12:00:00'" in sql
+
+
+def test_default_window_days(monkeypatch):
+    monkeypatch.setattr(apis.common, 'OLAP_DEFAULT_WINDOW_DAYS', 3)
+    sql = query({'created_at_end': NOW})
+    assert "BETWEEN '2026-01-29 00:00:00' AND '2026-01-31 12:00:00'" in sql
+
+
+def test_explicit_range():
+    sql = query({'created_at_start': NOW - timedelta(days=3), 'created_at_end': NOW})
+    assert sql.endswith("PREWHERE api_request_logs.created_at BETWEEN '2026-01-28 12:00:00' AND '2026-01-31 12:00:00'")
+
+
+def test_start_after_end():
+    with pytest.raises(APIErrorResponse) as info:
+        query({'created_at_start': NOW, 'created_at_end': NOW - timedelta(hours=1)})
+    assert info.value.status == 422
+
+
+@pytest.mark.parametrize('role, days, allowed', [
+    (RoleEnum.User, 31, True),
+    (RoleEnum.User, 32, False),
+    (None, 32, False),
+    (RoleEnum.Admin, 180, True),
+    (RoleEnum.Admin, 181, False),
+])
+def test_role_limit(role, days, allowed):
+    params = {'created_at_start': NOW - timedelta(days=days), 'created_at_end': NOW}
+    if allowed:
+        query(params, role)
+    else:
+        with pytest.raises(APIErrorResponse) as info:
+            query(params, role)
+        assert info.value.status == 422
+
+
+def test_window_follows_sample():
+    sql = select(ApiRequestLogs.id)
+    sql = time_window(sql, {'created_at_end': NOW}, ApiRequestLogs.created_at)
+    sql = compile_olap(sample_condition(sql, {'sample': 0.1}))
+    assert 'FROM api_request_logs SAMPLE 0.1\nPREWHERE api_request_logs.created_at BETWEEN' in sql
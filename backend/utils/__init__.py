@@ -10,29 +10,58 @@ import sys
 
 from loguru import logger
 
+from config import LOG_DEBUG_FILE_LEVEL
+from config import LOG_DIR
+from config import LOG_ENQUEUE
+from config import LOG_ERROR_FILE_LEVEL
+from config import LOG_JSON
+from config import LOG_REPEAT_INTERVAL
+from config import LOG_REPEAT_LIMIT
+from config import LOG_RETENTION
+from config import LOG_STDOUT_LEVEL
+from .classes import CaptchaPool
+from .classes import ColumnarResult
 from .classes import ImageCode
 from .classes import JSONExtensionEncoder
 from .classes import Kafka
+from .classes import KafkaSerializer
+from .classes import KafkaWorker
+from .classes import LogSampler
+from .classes import PasswordHasher
 from .classes import Redis
+from .classes import SingleFlight
 from .classes import Singleton
 from .constants import Constants
 from .functions import exceptions
+from .functions import execute_concurrently
 from .functions import execute_sql
 from .functions import generate_key
 
-# 日志记录
-if not os.path.exists('./logs'):
-    os.mkdir('./logs')
-logger.add(
-    './logs/DEBUG.log',
-    filter=lambda x: x['level'].name in ['TRACE', 'DEBUG', 'INFO'],
-    retention='1 days',
-    level='TRACE',
-)
-logger.add(
-    './logs/INFO.log',
-    filter=lambda x: x['level'].name in ['WARNING', 'ERROR', 'CRITICAL'],
-    retention='1 days',
-    level='WARNING',
-)
-logger.add(sys.stdout, colorize=True, format='{time:YYYY-MM-DD HH:mm:ss}|<level>{message}</level>')
+# 日志记录：移除loguru默认的stderr输出，按配置添加各个输出
+_sampler = LogSampler(LOG_REPEAT_INTERVAL, LOG_REPEAT_LIMIT)
+
+
+def _add_sink(sink, level, upper=None, **kwargs):
+    """
+    添加日志输出
+    Args:
+        sink: 文件路径或流
+        level: 最低级别，OFF表示不添加
+        upper: 只记录低于该级别的日志
+        **kwargs: logger.add的其他参数
+    """
+    if level.upper() == 'OFF':
+        return
+    if upper:
+        upper = logger.level(upper).no
+        kwargs['filter'] = lambda record: record['level'].no < upper and _sampler(record)
+    else:
+        kwargs['filter'] = _sampler
+    logger.add(sink, level=level.upper(), enqueue=LOG_ENQUEUE, serialize=LOG_JSON, **kwargs)
+
+
+logger.remove()
+os.makedirs(LOG_DIR, exist_ok=True)
+_add_sink(os.path.join(LOG_DIR, 'DEBUG.log'), LOG_DEBUG_FILE_LEVEL, 'WARNING', retention=LOG_RETENTION)
+_add_sink(os.path.join(LOG_DIR, 'INFO.log'), LOG_ERROR_FILE_LEVEL, retention=LOG_RETENTION)
+_add_sink(sys.stdout, LOG_STDOUT_LEVEL, colorize=not LOG_JSON, format='{time:YYYY-MM-DD HH:mm:ss}|<level>{message}</level>')
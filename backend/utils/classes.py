@@ -5,23 +5,54 @@ Author      : jinming.yang@qingteng.cn
 Description : 工具类定义
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 """
+import atexit
+import importlib.util
 import json
+import multiprocessing
+import os
 import random
+import signal
 import string
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait
 from datetime import datetime
+from io import BytesIO
 from ipaddress import IPv4Address
+from time import monotonic
+from time import sleep
+from time import time
+from typing import Callable
+from typing import Iterable
+from typing import Union
+from uuid import uuid4
 
-import redis
-from PIL import Image
-from PIL import ImageDraw
-from PIL import ImageFont
-from confluent_kafka import Consumer
-from confluent_kafka import Producer
 from sqlalchemy.engine import Row
 
+from config import CAPTCHA_POOL_SIZE
+from config import CAPTCHA_POOL_WATERMARK
+from config import CAPTCHA_RENDER_WORKERS
+from config import COALESCE_POLL_INTERVAL
+from config import COALESCE_REDIS
+from config import COALESCE_RESULT_TTL
+from config import COALESCE_TIMEOUT
 from config import KAFKA_CONSUMER_CONFIG
 from config import KAFKA_CONSUMER_TIMEOUT
+from config import KAFKA_PRODUCER_BLOCK_TIMEOUT
+from config import KAFKA_PRODUCER_BLOCKING
 from config import KAFKA_PRODUCER_CONFIG
+from config import KAFKA_TOPIC_FORMAT
+from config import KAFKA_WORKER_BATCH_SIZE
+from config import KAFKA_WORKER_CONSUMERS
+from config import KAFKA_WORKER_METRICS_INTERVAL
+from config import KAFKA_WORKER_THREADS
+from config import PASSWORD_HASH_QUEUE_SIZE
+from config import PASSWORD_HASH_TIMEOUT
+from config import PASSWORD_HASH_WORKERS
 from config import REDIS_HOST
 from config import REDIS_PORT
 from config import REDIS_PWD
@@ -29,97 +60,593 @@ from defines import *
 from utils import logger
 from .constants import Constants
 
-_redis_pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PWD, decode_responses=True)
-Redis = redis.Redis(connection_pool=_redis_pool)
+
+def _lazy_import(name: str):
+    """
+    延迟导入：返回的模块在首次访问其属性时才真正执行导入
+    PIL、Kafka、Redis导入耗时较长，而多数命令及进程只用到其中一部分
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+redis = _lazy_import('redis')
+confluent_kafka = _lazy_import('confluent_kafka')
+Image = _lazy_import('PIL.Image')
+ImageDraw = _lazy_import('PIL.ImageDraw')
+ImageFont = _lazy_import('PIL.ImageFont')
+
+
+def _create_redis():
+    pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PWD, decode_responses=True)
+    return redis.Redis(connection_pool=pool)
+
+
+def _close_redis(client):
+    client.close()
+    client.connection_pool.disconnect()
+
+
+# Redis客户端在首次使用时创建（连接池自身会检测fork，子进程不会复用父进程的连接）
+Redis = Resources.register('redis', _create_redis, _close_redis)
 
 
 # 单例基类
 class Singleton(type):
     _instances = {}
+    _lock = threading.RLock()  # 可重入：实例初始化时允许再创建其他单例
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+            with Singleton._lock:
+                # 双重检查：避免多个线程同时创建出多个实例
+                if cls not in cls._instances:
+                    cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
 
 
+class LogSampler:
+    """
+    重复日志采样：同一位置的相同错误在统计周期内只记录前limit条，其余的只计数，在下个周期的首条日志中汇总
+    作为各个sink共用的filter，每条日志只判断一次
+    """
+
+    def __init__(self, interval: float, limit: int, level: str = 'WARNING'):
+        """
+        Args:
+            interval: 统计周期（秒），不大于0时不进行采样
+            limit: 每个周期内最多记录的条数
+            level: 该级别及以上的日志才进行采样
+        """
+        self.interval = interval
+        self.limit = limit
+        self.level = logger.level(level).no
+        self._counters = {}  # {(模块, 方法, 行号, 异常类型): [周期开始时间, 本周期条数, 未记录的条数]}
+        self._lock = threading.Lock()
+        self._local = threading.local()  # 当前线程最近一次判断的(日志, 结果)，各sink依次调用filter时复用
+
+    def __call__(self, record) -> bool:
+        if self.interval <= 0 or record['level'].no < self.level:
+            return True
+        last = getattr(self._local, 'last', None)
+        if last is not None and last[0] is record:
+            return last[1]
+        result = self._sample(record)
+        self._local.last = (record, result)
+        return result
+
+    def _sample(self, record) -> bool:
+        exception = record['exception']
+        key = (record['name'], record['function'], record['line'], exception.type if exception else None)
+        now = monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.interval:
+                self._counters[key] = [now, 1, 0]
+                if counter and counter[2]:
+                    record['message'] += f'（此前{self.interval:g}秒内另有{counter[2]}条相同日志未记录）'
+                return True
+            counter[1] += 1
+            if counter[1] <= self.limit:
+                return True
+            counter[2] += 1
+            return False
+
+
 class Kafka(metaclass=Singleton):
+    """
+    Kafka客户端：每个进程共用一个生产者，消费者按(topic, group)区分
+    进程fork后会自动丢弃从父进程继承的客户端并重新创建
+    """
 
     def __init__(self):
+        self._client_lock = threading.Lock()  # 创建（重置）客户端的锁
+        self._reset()
+        atexit.register(self.close)  # 进程退出前把队列中的消息发送出去并关闭消费者
+        # 子进程丢弃从父进程继承的客户端（不需要在fork前等待父进程的队列发送完）
+        os.register_at_fork(after_in_child=self._reset_in_child)
+
+    def _reset(self):
+        """
+        初始化（或在fork后的子进程中重置）客户端状态
+        """
+        self._producer = None
         self._consumers = {}
-        self._producers = {}
+        self._lock = threading.Lock()  # 统计数据的锁
+        self._counter = {'delivered': 0, 'failed': 0, 'dropped': 0}
+        self._pid = os.getpid()
+
+    def _reset_in_child(self):
+        """
+        fork后的子进程中只有当前线程，父进程的锁可能正被其他线程持有，重新创建后再重置
+        """
+        self._client_lock = threading.Lock()
+        self._check_pid()
 
-    def get_consumer(self, topic: str) -> Consumer:
+    def _check_pid(self):
         """
-        为每个Topic创建单独的消费者
+        librdkafka的客户端不能跨进程使用，检测到进程变化时重置
+        """
+        if self._pid != os.getpid():
+            with self._client_lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    @property
+    def stats(self) -> dict:
+        """
+        生产者的发送统计：delivered 发送成功、failed 发送失败、dropped 队列已满被丢弃
+        """
+        with self._lock:
+            return dict(self._counter)
+
+    def get_consumer(self, topic: str, group: str = None) -> 'confluent_kafka.Consumer':
+        """
+        获取消费者，每个(topic, group)创建单独的消费者
         Args:
             topic: Topic名称
+            group: 消费组，默认使用KAFKA_CONSUMER_CONFIG中的group.id
 
         Returns:
             消费者对象
         """
-        if topic not in self._consumers:
-            self._consumers[topic] = Consumer(KAFKA_CONSUMER_CONFIG)
-            self._consumers[topic].subscribe([topic])
-        return self._consumers[topic]
+        self._check_pid()
+        key = (topic, group or KAFKA_CONSUMER_CONFIG['group.id'])
+        if key not in self._consumers:
+            with self._client_lock:
+                if key not in self._consumers:
+                    consumer = confluent_kafka.Consumer(KAFKA_CONSUMER_CONFIG | {'group.id': key[1]})
+                    consumer.subscribe([topic])
+                    self._consumers[key] = consumer
+        return self._consumers[key]
 
-    def get_producer(self, topic):
+    def get_producer(self, topic: str = None) -> 'confluent_kafka.Producer':
         """
-        为每个Topic创建单独的生产者
+        获取当前进程共用的生产者
         Args:
-            topic: Topic名称
+            topic: 已不再区分Topic，保留参数兼容旧的调用方式
 
         Returns:
             生产者对象
         """
-        if topic not in self._producers:
-            self._producers[topic] = Producer(KAFKA_PRODUCER_CONFIG)
-        return self._producers[topic]
+        self._check_pid()
+        if self._producer is None:
+            with self._client_lock:
+                if self._producer is None:
+                    self._producer = confluent_kafka.Producer(KAFKA_PRODUCER_CONFIG)
+        return self._producer
 
-    @staticmethod
-    def delivery_report(err, msg):
+    def delivery_report(self, err, msg):
         """
         callback 消息向kafka写入时 获取状态
         """
+        with self._lock:
+            if err is None:
+                self._counter['delivered'] += 1
+            else:
+                self._counter['failed'] += 1
         if err is not None:
-            logger.error('Message delivery failed', err)
+            logger.error('Message delivery failed: {}', err)
 
-    def consume(self, topic, limit=None):
+    @staticmethod
+    def get_serializer(topic: str):
+        """
+        获取Topic的消息序列化方式（通过KAFKA_TOPIC_FORMAT配置，默认json）
+        Args:
+            topic: Topic名称
+
+        Returns:
+            序列化对象
+        """
+        return KafkaSerializer.get(KAFKA_TOPIC_FORMAT.get(topic, 'json'))
+
+    def consume(self, topic, limit=None, group=None):
         """
         消费数据
         Args:
             topic: Topic名称
             limit: 批量获取数量（默认获取单条数据）
+            group: 消费组
 
         Returns:
-            json.loads后的数据
+            反序列化后的数据
         """
-        consumer = self.get_consumer(topic)
+        consumer = self.get_consumer(topic, group)
+        loads = self.get_serializer(topic).loads
         if limit:
             # 超时 有多少信息返回多少信息 无消息返回空列表 []
             msgs = consumer.consume(num_messages=limit, timeout=KAFKA_CONSUMER_TIMEOUT)
-            return [json.loads(msg.value().decode('utf-8')) for msg in msgs]
+            return [loads(msg.value()) for msg in msgs if not msg.error()]
         else:
             while True:
                 msg = consumer.poll(1.0)
                 if msg is None or msg.error():
                     continue
-                return json.loads(msg.value().decode('utf-8'))
+                return loads(msg.value())
+
+    def stream(self, topic, batch_size=500, timeout=1.0, raw=False, group=None):
+        """
+        以生成器的方式持续批量消费数据，只有拉取到消息时才产出
+        Args:
+            topic: Topic名称
+            batch_size: 单批最大消息数
+            timeout: 单次拉取的超时时间（秒）
+            raw: 是否跳过反序列化直接产出消息内容的memoryview
+            group: 消费组
+
+        Returns:
+            Generator[list]
+        """
+        consumer = self.get_consumer(topic, group)
+        loads = memoryview if raw else self.get_serializer(topic).loads
+        while True:
+            batch = []
+            for msg in consumer.consume(num_messages=batch_size, timeout=timeout):
+                if error := msg.error():
+                    if error.code() != confluent_kafka.KafkaError._PARTITION_EOF:
+                        logger.error(f'Kafka消费异常：{error}')
+                    continue
+                batch.append(loads(msg.value()))
+            if batch:
+                yield batch
+
+    def _produce(self, producer: 'confluent_kafka.Producer', topic: str, value: str, key=None) -> bool:
+        """
+        将消息放入发送队列，队列已满时按照配置阻塞等待或者丢弃
+        Returns:
+            是否成功放入队列
+        """
+        deadline = None
+        while True:
+            try:
+                producer.produce(topic=topic, value=value, key=key, on_delivery=self.delivery_report)
+                return True
+            except BufferError:
+                deadline = deadline or time() + KAFKA_PRODUCER_BLOCK_TIMEOUT
+                if not KAFKA_PRODUCER_BLOCKING or time() > deadline:
+                    with self._lock:
+                        self._counter['dropped'] += 1
+                    logger.warning(f'Kafka发送队列已满，丢弃消息：{topic}')
+                    return False
+                producer.poll(0.1)  # 等待队列中的消息发送出去后重试
 
-    def produce(self, topic, data):
+    def produce(self, topic, data, key=None):
         """
         生产数据
         Args:
             topic: Topic名称
             data: 带发送的数据
+            key: 消息的key，相同key的消息会写入同一个分区
 
         Returns:
-            None
+            是否成功放入发送队列
         """
+        producer = self.get_producer()
+        result = self._produce(producer, topic, self.get_serializer(topic).dumps(data), key)
+        producer.poll(0)
+        return result
+
+    def produce_many(self, topic, rows: Iterable, key: Union[str, Callable] = None):
+        """
+        批量生产数据：全部放入发送队列后由librdkafka按linger/batch配置合并、压缩后发送
+        Args:
+            topic: Topic名称
+            rows: 待发送的数据
+            key: 消息的key，可以是数据中的字段名称或者根据数据生成key的函数
 
-        producer = self.get_producer(topic)
-        producer.produce(topic=topic, value=json.dumps(data, cls=JSONExtensionEncoder), callback=self.delivery_report)
+        Returns:
+            成功放入发送队列的数量
+        """
+        producer = self.get_producer()
+        dumps = self.get_serializer(topic).dumps
+        count = 0
+        for row in rows:
+            if key is None:
+                msg_key = None
+            elif callable(key):
+                msg_key = key(row)
+            else:
+                msg_key = row[key]
+            if msg_key is not None:
+                msg_key = str(msg_key)
+            count += self._produce(producer, topic, dumps(row), msg_key)
         producer.poll(0)
+        return count
+
+    def flush(self, timeout=10):
+        """
+        等待发送队列中的消息全部发送完成
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            未发送完成的消息数量
+        """
+        if self._producer is None or self._pid != os.getpid():
+            return 0
+        if remain := self._producer.flush(timeout):
+            logger.warning(f'Kafka仍有{remain}条消息未发送完成')
+        return remain
+
+    def close(self, timeout=10):
+        """
+        发送完队列中的消息并关闭全部消费者（进程退出时自动调用）
+        Args:
+            timeout: 等待消息发送的超时时间（秒）
+        """
+        if self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        with self._client_lock:
+            for consumer in self._consumers.values():
+                try:
+                    consumer.close()
+                except Exception as ex:
+                    logger.exception(ex)
+            self._consumers.clear()
+
+
+class _ConsumerState:
+    """
+    KafkaWorker中单个消费者的rebalance状态
+    """
+    __slots__ = ('processing', 'revoked', 'buffer')
+
+    def __init__(self):
+        self.processing = False  # 是否正在处理批次（期间分区处于暂停状态）
+        self.revoked = set()  # 处理批次期间被收回的分区
+        self.buffer = []  # 处理批次期间拉取到的消息
+
+    def add(self, msg):
+        if msg.error() or (msg.topic(), msg.partition()) not in self.revoked:
+            self.buffer.append(msg)
+
+    def take(self) -> list:
+        messages, self.buffer = self.buffer, []
+        return messages
+
+    def on_assign(self, consumer, partitions):
+        consumer.assign(partitions)
+        if self.processing:
+            # 处理批次期间新分配的分区先暂停，批次结束后统一恢复
+            consumer.pause(partitions)
+
+    def discard(self, partitions: set):
+        """
+        丢弃缓存中指定分区的消息（分区被收回或回退offset后会重新拉取）
+        """
+        self.buffer = [msg for msg in self.buffer if (msg.topic(), msg.partition()) not in partitions]
+
+    def on_revoke(self, _, partitions):
+        revoked = {(tp.topic, tp.partition) for tp in partitions}
+        if self.processing:
+            self.revoked.update(revoked)
+        self.discard(revoked)
+
+
+class KafkaWorker:
+    """
+    Kafka消费进程：按Topic注册处理函数，批量消费、并行处理，处理成功后再手动提交offset
+    """
+    _handlers = {}
+
+    @classmethod
+    def handler(cls, topic: str):
+        """
+        装饰器：注册Topic的处理函数，处理函数接收反序列化后的消息列表，抛出异常则该批消息会重新消费
+        Args:
+            topic: Topic名称
+        """
+
+        def decorator(func):
+            cls._handlers[topic] = func
+            return func
+
+        return decorator
+
+    def __init__(self, consumers=KAFKA_WORKER_CONSUMERS, threads=KAFKA_WORKER_THREADS,
+                 batch_size=KAFKA_WORKER_BATCH_SIZE):
+        """
+        Args:
+            consumers: 消费者数量，0表示与Topic的最大分区数一致
+            threads: 执行处理函数的线程数
+            batch_size: 每个消费者单次拉取的最大消息数
+        """
+        self.consumers = consumers
+        self.threads = threads
+        self.batch_size = batch_size
+        self._config = KAFKA_CONSUMER_CONFIG | {'enable.auto.commit': False}
+        self._stop = threading.Event()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._counter = {topic: {'processed': 0, 'failed': 0} for topic in self._handlers}
+        self._lag = {}
+
+    def stop(self, *_):
+        """
+        通知所有消费者处理完当前批次后退出
+        """
+        self._stop.set()
+
+    @property
+    def stats(self) -> dict:
+        """
+        各Topic的累计处理数量及各分区的积压数量
+        """
+        with self._lock:
+            return {
+                topic: {
+                    **counter,
+                    'lag': sum(lag for (t, _), lag in self._lag.items() if t == topic),
+                } for topic, counter in self._counter.items()
+            }
+
+    def _get_consumer_count(self, topics) -> int:
+        """
+        计算消费者数量：未指定时按Topic的最大分区数创建，保证每个分区都能被并行消费
+        """
+        if self.consumers > 0:
+            return self.consumers
+        probe = confluent_kafka.Consumer(self._config)
+        try:
+            metadata = probe.list_topics(timeout=10)
+            return max([len(metadata.topics[t].partitions) for t in topics if t in metadata.topics] or [1])
+        finally:
+            probe.close()
+
+    def _handle(self, topic, messages):
+        """
+        在线程池中解码并执行处理函数
+        """
+        loads = Kafka.get_serializer(topic).loads
+        self._handlers[topic]([loads(msg.value()) for msg in messages])
+
+    def _process(self, consumer: 'confluent_kafka.Consumer', messages: list, state: '_ConsumerState'):
+        """
+        按分区拆分批次并行处理，全部结束后提交成功分区的offset，失败的分区回退到批次开头重新消费，
+        处理期间被rebalance收回的分区不提交也不回退（由新的消费者从已提交的offset继续消费）
+        """
+        batches = {}
+        for msg in messages:
+            if msg.error():
+                if msg.error().code() != confluent_kafka.KafkaError._PARTITION_EOF:
+                    logger.error(f'Kafka消费异常：{msg.error()}')
+                continue
+            batches.setdefault((msg.topic(), msg.partition()), []).append(msg)
+        if not batches:
+            return
+        futures = {key: self._executor.submit(self._handle, key[0], batch) for key, batch in batches.items()}
+        # 处理函数跟不上时暂停拉取，poll只用来维持心跳及响应rebalance（新分配的分区在on_assign中暂停）
+        state.processing = True
+        state.revoked.clear()
+        consumer.pause(consumer.assignment())
+        try:
+            while wait(futures.values(), timeout=1.0).not_done:
+                if (msg := consumer.poll(0)) is not None:
+                    # 暂停生效前已经拉取的消息留到下一批处理，不能丢弃
+                    state.add(msg)
+        finally:
+            state.processing = False
+            offsets, failed = [], set()
+            for (topic, partition), future in futures.items():
+                batch = batches[(topic, partition)]
+                if (topic, partition) in state.revoked:
+                    continue
+                if error := future.exception():
+                    logger.opt(exception=error).error(f'Kafka处理失败：{topic}[{partition}]')
+                    failed.add((topic, partition))
+                    try:
+                        consumer.seek(confluent_kafka.TopicPartition(topic, partition, batch[0].offset()))
+                    except confluent_kafka.KafkaException as ex:
+                        logger.warning(f'Kafka回退offset失败：{topic}[{partition}]，{ex}')
+                    with self._lock:
+                        self._counter[topic]['failed'] += len(batch)
+                else:
+                    offsets.append(confluent_kafka.TopicPartition(topic, partition, batch[-1].offset() + 1))
+                    with self._lock:
+                        self._counter[topic]['processed'] += len(batch)
+            # 失败分区之后的消息回退后会重新拉取，缓存的不能先处理，否则会越过失败的消息提交offset
+            state.discard(failed)
+            if offsets:
+                try:
+                    consumer.commit(offsets=offsets, asynchronous=False)
+                except confluent_kafka.KafkaException as ex:
+                    # rebalance导致提交失败时这些消息会被重新消费，消费者继续运行
+                    logger.warning(f'Kafka提交offset失败：{ex}')
+            consumer.resume(consumer.assignment())
+        if failed:
+            self._stop.wait(1)  # 失败重试前稍作等待，避免异常消息导致空转
+
+    def _update_lag(self, consumer: 'confluent_kafka.Consumer'):
+        """
+        统计当前消费者分配到的分区的积压数量
+        """
+        for tp in consumer.position(consumer.assignment()):
+            if tp.offset < 0:
+                continue
+            _, high = consumer.get_watermark_offsets(tp, timeout=5)
+            with self._lock:
+                self._lag[(tp.topic, tp.partition)] = max(high - tp.offset, 0)
+
+    def _consume(self, topics):
+        """
+        单个消费者的消费循环
+        """
+        consumer = confluent_kafka.Consumer(self._config)
+        state = _ConsumerState()
+        consumer.subscribe(topics, on_assign=state.on_assign, on_revoke=state.on_revoke)
+        reported_at = time()
+        try:
+            while not self._stop.is_set():
+                buffered = state.take()
+                messages = consumer.consume(num_messages=self.batch_size, timeout=0 if buffered else 1.0)
+                if messages := buffered + messages:
+                    self._process(consumer, messages, state)
+                if time() - reported_at >= KAFKA_WORKER_METRICS_INTERVAL:
+                    self._update_lag(consumer)
+                    reported_at = time()
+        except Exception as ex:
+            logger.exception(ex)
+            self.stop()
+        finally:
+            consumer.close()
+
+    def run(self):
+        """
+        启动全部消费者并阻塞直到收到SIGINT/SIGTERM
+        """
+        if not (topics := list(self._handlers)):
+            logger.warning('没有注册任何Kafka处理函数')
+            return
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        count = self._get_consumer_count(topics)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='kafka-handler')
+        workers = [
+            threading.Thread(target=self._consume, args=(topics,), name=f'kafka-consumer-{i}')
+            for i in range(count)
+        ]
+        for worker in workers:
+            worker.start()
+        logger.info(f'Kafka消费进程已启动：{count}个消费者，Topic：{topics}')
+        last, last_at = self.stats, time()
+        while not self._stop.wait(KAFKA_WORKER_METRICS_INTERVAL):
+            current, now = self.stats, time()
+            for topic, item in current.items():
+                rate = (item['processed'] - last[topic]['processed']) / (now - last_at)
+                logger.info(f'Kafka[{topic}] 吞吐：{rate:.1f}条/秒，积压：{item["lag"]}，累计：{item}')
+            last, last_at = current, now
+        for worker in workers:
+            worker.join()
+        self._executor.shutdown(wait=True)
+        logger.info(f'Kafka消费进程已退出：{self.stats}')
 
 
 class JSONExtensionEncoder(json.JSONEncoder):
@@ -134,15 +661,275 @@ class JSONExtensionEncoder(json.JSONEncoder):
             return obj.strftime(Constants.DEFINE_DATE_FORMAT)
         if isinstance(obj, Row):
             return dict(obj._mapping)
-        if isinstance(obj, ModelTemplate):
+        if isinstance(obj, (ModelTemplate, ModelRecord)):
             return obj.json()
         if isinstance(obj, IPv4Address):
             return str(obj)
         return json.JSONEncoder.default(self, obj)
 
 
+def _numpy():
+    """
+    numpy、pandas只有列式查询需要，使用时再导入
+    """
+    try:
+        import numpy
+        import pandas
+    except ImportError:
+        raise RuntimeError('列式查询需要安装numpy及pandas（clickhouse-driver[numpy]）')
+    return numpy, pandas
+
+
+class ColumnarResult:
+    """
+    ClickHouse的列式查询结果：每一列是一个numpy数组，按列名访问
+    """
+
+    def __init__(self, columns_with_types, data):
+        np, _ = _numpy()
+        self.names = [name for name, _ in columns_with_types]
+        self.types = dict(columns_with_types)
+        if data:
+            # use_numpy时数值、时间列已经是ndarray，其他类型（LowCardinality、IPv4等）是Categorical或tuple
+            self.columns = {name: self._to_array(np, column) for name, column in zip(self.names, data)}
+        else:
+            self.columns = {name: np.empty(0, dtype=object) for name in self.names}
+
+    @staticmethod
+    def _to_array(np, column):
+        if isinstance(column, (tuple, list)) and column and not isinstance(column[0], (str, int, float, bool)):
+            # IPv4Address等对象直接按object构造，避免numpy逐个探测是否为序列
+            return np.fromiter(column, dtype=object, count=len(column))
+        return np.asarray(column)
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, column):
+        if name not in self.columns:
+            self.names.append(name)
+        self.columns[name] = column
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @staticmethod
+    def map_column(column, mapping: dict, default=None):
+        """
+        向量化的列映射：先对列去重编码，只对去重后的值查找mapping，再按编码整列展开
+        Args:
+            column: 列（ndarray）
+            mapping: 映射关系
+            default: 映射不到时的默认值
+
+        Returns:
+            映射后的列（ndarray）
+        """
+        np, pd = _numpy()
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        return np.array([mapping.get(key, default) for key in uniques.tolist()], dtype=object)[codes]
+
+    def unique(self, name) -> list:
+        """
+        列中不重复的取值（按首次出现的顺序）
+        """
+        _, pd = _numpy()
+        return pd.unique(self.columns[name]).tolist()
+
+    def map(self, name, mapping: dict, default=None, alias: str = None):
+        """
+        将列按照mapping映射为新的列（例如user_id映射为account）
+        Args:
+            name: 列名
+            mapping: 映射关系
+            default: 映射不到时的默认值
+            alias: 新的列名，默认覆盖原列
+
+        Returns:
+            映射后的列
+        """
+        self[alias or name] = column = self.map_column(self.columns[name], mapping, default)
+        return column
+
+    def value_counts(self, name, top: int = None) -> dict:
+        """
+        统计列中各个取值的数量
+        Args:
+            name: 列名
+            top: 只返回数量最多的前top个，默认全部
+
+        Returns:
+            {取值: 数量}（按数量倒序）
+        """
+        np, pd = _numpy()
+        codes, uniques = pd.factorize(self.columns[name], use_na_sentinel=False)
+        counts = np.bincount(codes, minlength=len(uniques))
+        order = np.argsort(-counts, kind='stable')[:top]
+        return dict(zip(np.asarray(uniques, dtype=object)[order].tolist(), counts[order].tolist()))
+
+    def describe(self, name, percentiles: Iterable = (50, 95, 99)) -> dict:
+        """
+        数值列的统计信息
+        Args:
+            name: 列名
+            percentiles: 需要计算的百分位
+
+        Returns:
+            {'min': 最小值, 'max': 最大值, 'avg': 平均值, 'p50': 百分位值, ...}
+        """
+        np, _ = _numpy()
+        column = self.columns[name]
+        if not len(column):
+            return {}
+        percentiles = list(percentiles)
+        result = {'min': column.min().item(), 'max': column.max().item(), 'avg': float(column.mean())}
+        for percentile, value in zip(percentiles, np.percentile(column, percentiles).tolist()):
+            result[f'p{percentile}'] = value
+        return result
+
+    def drop(self, *names):
+        """
+        删除列
+        """
+        for name in names:
+            self.names.remove(name)
+            del self.columns[name]
+
+    def tolist(self, name) -> list:
+        """
+        将列转为可以JSON序列化的list
+        """
+        np, pd = _numpy()
+        column = self.columns[name]
+        if np.issubdtype(column.dtype, np.datetime64):
+            # 时间列整列格式化为DEFINE_DATE_FORMAT
+            return np.char.replace(np.datetime_as_string(column, unit='s'), 'T', ' ').tolist()
+        if column.dtype == object and len(column) and not isinstance(column[0], (str, int, float, bool)):
+            # 不可直接序列化的类型（IPv4Address、枚举等）只转换去重后的值
+            encoder = JSONExtensionEncoder().default
+            codes, uniques = pd.factorize(column, use_na_sentinel=False)
+            values = [None if item is None else encoder(item) for item in uniques.tolist()]
+            return np.array(values, dtype=object)[codes].tolist()
+        return column.tolist()
+
+    def records(self) -> list:
+        """
+        转为按行的dict列表
+        """
+        return [dict(zip(self.names, row)) for row in zip(*(self.tolist(name) for name in self.names))]
+
+    def json(self, orient: str = 'records'):
+        """
+        转为可以序列化的对象
+        Args:
+            orient: records：按行的dict列表；columns：{列名: list}
+
+        Returns:
+            list或dict
+        """
+        if orient == 'columns':
+            return {name: self.tolist(name) for name in self.names}
+        return self.records()
+
+    def to_arrow(self):
+        """
+        转为pyarrow.Table（需要安装pyarrow）
+        """
+        import pyarrow
+        return pyarrow.table({name: self.columns[name] for name in self.names})
+
+
+class KafkaSerializer:
+    """
+    Kafka消息的序列化方式，通过name注册
+    """
+    name = None
+    _instances = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        KafkaSerializer._instances[cls.name] = cls()
+
+    @staticmethod
+    def get(name: str) -> 'KafkaSerializer':
+        """
+        根据名称获取序列化方式
+        """
+        if name not in KafkaSerializer._instances:
+            raise KeyError(f'不支持的Kafka消息格式：{name}')
+        return KafkaSerializer._instances[name]
+
+    def dumps(self, data) -> Union[str, bytes]:
+        raise NotImplementedError
+
+    def loads(self, value: bytes):
+        raise NotImplementedError
+
+
+class JSONSerializer(KafkaSerializer):
+    name = 'json'
+
+    def __init__(self):
+        self._encoder = JSONExtensionEncoder()
+
+    def dumps(self, data):
+        return self._encoder.encode(data)
+
+    def loads(self, value):
+        # 先decode再loads比直接传bytes快（bytes需要先检测编码）
+        return json.loads(value.decode('utf-8'))
+
+
+class MsgpackSerializer(KafkaSerializer):
+    name = 'msgpack'
+
+    def __init__(self):
+        self._msgpack = None
+        self._encoder = JSONExtensionEncoder()
+
+    @property
+    def msgpack(self):
+        # msgpack只有配置了该格式的Topic才需要，使用时再导入
+        if self._msgpack is None:
+            import msgpack
+            self._msgpack = msgpack
+        return self._msgpack
+
+    def dumps(self, data):
+        return self.msgpack.packb(data, default=self._encoder.default)
+
+    def loads(self, value):
+        return self.msgpack.unpackb(value)
+
+
+class RawSerializer(KafkaSerializer):
+    """
+    不做任何转换：发送bytes/str，消费时返回memoryview
+    """
+    name = 'raw'
+
+    def dumps(self, data):
+        return data
+
+    def loads(self, value):
+        return memoryview(value)
+
+
 class ImageCode:
     CODE_LEN = 4
+    _font = None  # 字体只加载一次（多进程渲染时每个进程各加载一次）
+
+    @classmethod
+    def get_font(cls):
+        """
+        获取绘制验证码的字体
+        """
+        if cls._font is None:
+            cls._font = ImageFont.truetype(font='arial.ttf', size=40)  # 选择使用何种字体及字体大小
+        return cls._font
 
     @staticmethod
     def rand_color():
@@ -181,7 +968,7 @@ class ImageCode:
         code = self.gen_text()
         width, height = 120, 50  # 设定图片大小，可根据实际需求调整
         im = Image.new('RGB', (width, height), 'white')  # 创建图片对象，并设定背景色为白色
-        font = ImageFont.truetype(font='arial.ttf', size=40)  # 选择使用何种字体及字体大小
+        font = self.get_font()
         draw = ImageDraw.Draw(im)  # 新建ImageDraw对象
 
         # 绘制字符串
@@ -195,3 +982,306 @@ class ImageCode:
             # self.draw_lines(draw, 4, width, height)  # 绘制干扰线
         # im.show()  # 如需临时调试，可以直接将生成的图片显示出来
         return im, code
+
+    @staticmethod
+    def render(_=None):
+        """
+        绘制验证码并编码成PNG（可以直接提交到进程池中执行）
+        Returns:
+            (验证码, PNG图片数据)
+        """
+        im, code = ImageCode().draw_verify_code()
+        with BytesIO() as imgio:
+            im.save(imgio, 'png')
+            return code, imgio.getvalue()
+
+
+class CaptchaPool(metaclass=Singleton):
+    """
+    预先渲染的验证码池：请求时直接取出，数量低于水位线时由后台线程补充
+    """
+
+    def __init__(self):
+        self.hits = 0  # 直接从池中取到验证码的次数
+        self.misses = 0  # 池为空时同步渲染的次数
+        self._pool = deque(maxlen=CAPTCHA_POOL_SIZE)
+        self._refill_event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+
+    @property
+    def stats(self) -> dict:
+        """
+        验证码池的统计信息
+        """
+        with self._lock:
+            return {'size': len(self._pool), 'hits': self.hits, 'misses': self.misses}
+
+    def _start(self):
+        """
+        启动后台补充线程（第一次取验证码时才启动，避免在fork前创建线程）
+        """
+        with self._lock:
+            if self._thread is None:
+                if CAPTCHA_RENDER_WORKERS > 0:
+                    # 使用spawn创建渲染进程，避免在多线程环境下fork导致子进程死锁
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=CAPTCHA_RENDER_WORKERS,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                self._thread = threading.Thread(target=self._refill, name='captcha-refill', daemon=True)
+                self._thread.start()
+                self._refill_event.set()
+
+    def _refill(self):
+        """
+        后台补充验证码直到填满
+        """
+        while True:
+            self._refill_event.wait()
+            self._refill_event.clear()
+            try:
+                while (missing := CAPTCHA_POOL_SIZE - len(self._pool)) > 0:
+                    if self._executor:
+                        self._pool.extend(self._executor.map(ImageCode.render, range(missing)))
+                    else:
+                        self._pool.append(ImageCode.render())
+            except Exception as ex:
+                logger.exception(ex)
+
+    def pop(self):
+        """
+        获取一个验证码
+        Returns:
+            (验证码, PNG图片数据)
+        """
+        if self._thread is None:
+            self._start()
+        try:
+            item = self._pool.popleft()
+            hit = True
+        except IndexError:
+            # 池已耗尽则在请求中同步渲染
+            item = ImageCode.render()
+            hit = False
+        with self._lock:
+            # +=不是原子操作，并发请求下需要加锁计数
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if len(self._pool) < CAPTCHA_POOL_WATERMARK:
+            self._refill_event.set()
+        return item
+
+
+class PasswordHasher(metaclass=Singleton):
+    """
+    在独立的进程池中执行密码哈希（KDF）计算，避免大量登录时阻塞其他接口
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE_SIZE)
+
+    def _get_executor(self):
+        """
+        第一次使用时才创建进程池
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=PASSWORD_HASH_WORKERS,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+        return self._executor
+
+    def _execute(self, func, *args):
+        """
+        提交哈希任务并等待结果
+        Args:
+            func: 需要执行的函数
+            *args: 函数参数
+
+        Returns:
+            函数返回值
+        """
+        if PASSWORD_HASH_WORKERS <= 0:
+            return func(*args)
+        # 排队和计算共用一个截止时间，总等待时间不超过PASSWORD_HASH_TIMEOUT
+        deadline = monotonic() + PASSWORD_HASH_TIMEOUT
+        if not self._slots.acquire(timeout=PASSWORD_HASH_TIMEOUT):
+            raise TimeoutError('密码哈希任务排队已满')
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # 任务真正结束后才释放名额，超时的任务仍然占用队列，避免积压
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(deadline - monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError('密码哈希任务超时')
+
+    def generate(self, raw_password: str) -> str:
+        """
+        生成密码哈希
+        Args:
+            raw_password: 明文密码
+
+        Returns:
+            密码哈希
+        """
+        return self._execute(User.generate_hash, raw_password)
+
+    def check(self, user: User, raw_password: str) -> bool:
+        """
+        校验密码，校验成功且哈希参数已经变化时自动更新用户的密码哈希
+        Args:
+            user: 用户实例（需要在session中才能保存更新后的哈希）
+            raw_password: 明文密码
+
+        Returns:
+            密码是否正确
+        """
+        if not user.password or not self._execute(User.verify_hash, user.password, raw_password):
+            return False
+        if user.need_rehash():
+            user.password = self.generate(raw_password)
+        return True
+
+
+class _Flight:
+    """
+    执行中的一次调用
+    """
+    __slots__ = ('event', 'result', 'ok')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.ok = False
+
+
+class SingleFlight(metaclass=Singleton):
+    """
+    合并并发的相同调用：同一个key同时只执行一次，其他调用等待并共享执行结果
+    进程内通过Event等待；开启COALESCE_REDIS后再通过Redis锁在多个worker之间选出执行者，结果短暂写入Redis供其他worker读取
+    共享的结果需要能JSON序列化
+    """
+
+    def __init__(self):
+        self._flights = {}  # {key: _Flight}
+        self._lock = threading.Lock()
+        self._stats = {}  # {分组: [请求数, 实际执行数, 进程内共享数, 跨进程共享数, 等待超时后自行执行数]}
+
+    @property
+    def stats(self) -> dict:
+        """
+        各分组的合并统计，fan_in为平均每次实际执行服务的请求数
+        """
+        result = {}
+        for group, (requests, executions, shared, remote, fallback) in list(self._stats.items()):
+            result[group] = {
+                'requests': requests,
+                'executions': executions,
+                'shared': shared,
+                'remote_shared': remote,
+                'fallback': fallback,
+                'fan_in': round(requests / executions, 2) if executions else None,
+            }
+        return result
+
+    def _count(self, group, index):
+        with self._lock:
+            counter = self._stats.setdefault(group, [0, 0, 0, 0, 0])
+            counter[0] += 1
+            counter[index] += 1
+
+    def do(self, group: str, key: str, func: Callable):
+        """
+        执行调用，已经有相同的调用在执行时等待其结果
+        Args:
+            group: 统计分组（例如接口名称）
+            key: 调用的唯一标识，相同的key视为相同的调用
+            func: 无参的执行函数
+
+        Returns:
+            func的返回值
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            # 执行者失败时不共享异常，由各自重新执行
+            if flight.event.wait(COALESCE_TIMEOUT) and flight.ok:
+                self._count(group, 2)
+                return flight.result
+            self._count(group, 4)
+            return func()
+        try:
+            if COALESCE_REDIS:
+                flight.result = self._do_remote(group, key, func)
+            else:
+                self._count(group, 1)
+                flight.result = func()
+            flight.ok = True
+            return flight.result
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    def _do_remote(self, group, key, func):
+        """
+        通过Redis锁在多个进程间合并
+        """
+        # 锁的值是每次执行的token，结果按token保存，等待者只读取当前这次执行的结果，不会读到之前残留的结果
+        lock_key, token = f'coalesce:lock:{key}', uuid4().hex
+        try:
+            lock = Redis.lock(lock_key, timeout=COALESCE_TIMEOUT, blocking=False)
+            acquired = lock.acquire(token=token)
+        except redis.RedisError as ex:
+            logger.warning(f'请求合并无法使用Redis：{ex}')
+            self._count(group, 1)
+            return func()
+        if acquired:
+            self._count(group, 1)
+            try:
+                result = func()
+                try:
+                    Redis.set(f'coalesce:result:{key}:{token}', json.dumps(result), px=int(COALESCE_RESULT_TTL * 1000))
+                except redis.RedisError as ex:
+                    logger.warning(f'请求合并无法使用Redis：{ex}')
+                return result
+            finally:
+                try:
+                    lock.release()
+                except redis.RedisError:
+                    pass  # 锁已超时释放
+        # 其他进程正在执行：轮询这次执行的结果，锁释放后仍没有结果说明执行失败，由自己执行
+        try:
+            if (token := Redis.get(lock_key)) is not None:
+                result_key = f'coalesce:result:{key}:{token}'
+                deadline = time() + COALESCE_TIMEOUT
+                while time() < deadline:
+                    if (value := Redis.get(result_key)) is not None:
+                        self._count(group, 3)
+                        return json.loads(value)
+                    if Redis.get(lock_key) != token:
+                        if (value := Redis.get(result_key)) is not None:
+                            self._count(group, 3)
+                            return json.loads(value)
+                        break
+                    sleep(COALESCE_POLL_INTERVAL)
+        except redis.RedisError as ex:
+            logger.warning(f'请求合并无法使用Redis：{ex}')
+        self._count(group, 4)
+        return func()
@@ -5,58 +5,177 @@ Author      : jinming.yang
 Description : 基础方法的定义实现
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 """
+import contextvars
+import math
+import threading
 import uuid
+from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from functools import wraps
+from time import monotonic
 from typing import Union
 
-from clickhouse_driver import Client
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
 from config import DATABASE_OLAP_URI
+from config import QUERY_CONCURRENT_TIMEOUT
+from config import QUERY_CONCURRENT_WORKERS
 from defines import *
 from utils import logger
+from .classes import ColumnarResult
 
 _OLAP_TABLES = {item.__tablename__ for item in OLAPModelsDict.values()}
+# 列式查询使用的开启了use_numpy的连接
+_OLAP_NUMPY_URI = f'{DATABASE_OLAP_URI}{"&" if "?" in DATABASE_OLAP_URI else "?"}use_numpy=true'
+# 执行并发查询的线程池（按进程创建）
+_QueryExecutor = Resources.register(
+    'query_executor',
+    lambda: ThreadPoolExecutor(max_workers=QUERY_CONCURRENT_WORKERS, thread_name_prefix='query'),
+    lambda executor: executor.shutdown(wait=False, cancel_futures=True),
+)
+# 当前线程正在执行的并发查询
+_query_local = threading.local()
 
 
-def execute_sql(sql, *, many: bool = False, scalar: bool = True, params=None, session=None):
+class _QueryTask:
+    """
+    并发查询中的单个查询：记录取消执行中查询的方法
+    """
+    __slots__ = ('sql', 'options', 'timeout', 'canceller', 'cancelled', 'lock', 'client')
+
+    def __init__(self, sql, options: dict, timeout: float):
+        self.sql = sql
+        self.options = options
+        self.timeout = timeout
+        self.canceller = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.client = None  # 设置了查询超时的OLAP客户端
+
+    def bind(self, session):
+        """
+        查询创建连接后登记取消方法（在执行查询的线程中调用）
+        """
+        if isinstance(session, Session):
+            dbapi_connection = session.connection().connection.dbapi_connection
+            # psycopg2的cancel、sqlite3的interrupt都可以在其他线程中调用
+            canceller = getattr(dbapi_connection, 'cancel', None) or getattr(dbapi_connection, 'interrupt', None)
+        else:
+            session.settings['max_execution_time'] = math.ceil(self.timeout)
+            canceller = session.connection.send_cancel
+            self.client = session
+        with self.lock:
+            if self.cancelled:
+                raise TimeoutError('查询已取消')
+            self.canceller = canceller
+
+    def unbind(self):
+        """
+        连接归还连接池前清除取消方法，避免取消到复用该连接的其他查询
+        """
+        with self.lock:
+            self.canceller = None
+            client, self.client = self.client, None
+        if client is not None:
+            # 超时只针对本次查询，调用方提供的客户端之后还会执行其他查询
+            client.settings.pop('max_execution_time', None)
+
+    def cancel(self):
+        """
+        取消查询（在其他线程中调用）
+        """
+        with self.lock:
+            self.cancelled = True
+            if self.canceller:
+                try:
+                    self.canceller()
+                except Exception as ex:
+                    logger.debug(f'取消查询失败：{ex}')
+
+    def run(self):
+        _query_local.task = self
+        try:
+            if (session := self.options.get('session')) is not None:
+                # 调用方提供的连接在这里登记，execute_sql自动创建的连接在创建后登记
+                self.bind(session)
+            elif self.cancelled:
+                raise TimeoutError('查询已取消')
+            return execute_sql(self.sql, raise_error=True, **self.options)
+        finally:
+            self.unbind()
+            _query_local.task = None
+
+
+def execute_sql(
+        sql,
+        *,
+        many: bool = False,
+        scalar: bool = True,
+        record: bool = False,
+        columnar: bool = False,
+        params=None,
+        session=None,
+        raise_error: bool = False
+):
     """
     执行SQL语句
     Args:
         sql: SQLAlchemy SQL语句对象
         many: 是否查询多行数据，默认值为False
         scalar: 查询model时返回model实例，如果指定了查询的列则不需要，默认值为True
+        record: 查询model时返回只读的轻量记录（ModelRecord）而不是ORM实例，适用于只读的场景，默认值为False
+        columnar: OLAP查询按列返回ColumnarResult（numpy数组），适用于大量数据的统计分析，默认值为False
         params: 批量插入类操作时插入的数据，默认值为None
         session: 执行SQL的session，默认不需要，会自动创建，但是如果有上下文需要使用相同的也可以传递
+        raise_error: 执行失败时抛出异常而不是返回错误消息，默认值为False
 
     Returns:
-        当SQL是查询类语句时：返回列表、实例对象、Row对象
+        当SQL是查询类语句时：返回列表、实例对象、记录对象、Row对象、ColumnarResult
         当SQL是非查询类语句时：返回受影响的行数/错误消息/None, 是否执行成功
     """
-    tp_flag = not isinstance(session, Client)
+    tp_flag = session is None or isinstance(session, Session)
+    statement, record_cls = sql, None
     if sql.is_select:
+        if record and scalar and len(descriptions := sql.column_descriptions) == 1:
+            model = descriptions[0]['expr']
+            if isinstance(model, type) and issubclass(model, ModelTemplate):
+                # 只查询model的列，结果行直接构造为记录，不经过ORM实例化
+                record_cls = model.record_class()
+                sql = sql.with_only_columns(*model.to_property(record_cls.fields))
         if session_flag := session is None:
             if sql.froms[0].name in _OLAP_TABLES:
                 tp_flag = False
-                session = Client.from_url(DATABASE_OLAP_URI)
+                session = olap_client(_OLAP_NUMPY_URI if columnar else DATABASE_OLAP_URI)
             else:
-                session = Session(OLTPEngine)
+                # 查询优先走只读副本
+                session = Session(OLTPRouter.get_engine())
     else:
         if session_flag := session is None:
             if sql.table.name in _OLAP_TABLES:
                 tp_flag = False
-                session = Client.from_url(DATABASE_OLAP_URI)
+                session = olap_client()
             else:
                 session = Session(OLTPEngine)
     try:
         if sql.is_select:
+            if session_flag and (task := getattr(_query_local, 'task', None)):
+                # 并发查询中登记新建连接的取消方法
+                task.bind(session)
             if not tp_flag:
-                sql = sql.compile(compile_kwargs={'literal_binds': True}).string
+                sql = compile_olap(sql)
+                if columnar:
+                    # 外部传入的session未开启use_numpy时各列是tuple，由ColumnarResult转为数组
+                    data, columns_with_types = session.execute(sql, columnar=True, with_column_types=True)
+                    return ColumnarResult(columns_with_types, data)
             executed = session.execute(sql)
             if many:
                 result = executed.fetchall() if tp_flag else executed
-                if scalar:
+                if record_cls:
+                    result = list(map(record_cls.make, result))
+                elif scalar:
                     result = [row[0] for row in result]
             else:
                 if tp_flag:
@@ -66,9 +185,11 @@ def execute_sql(sql, *, many: bool = False, scalar: bool = True, params=None, se
                         result = executed[0]
                     else:
                         return None
-                if scalar and result:
+                if record_cls and result:
+                    result = record_cls.make(result)
+                elif scalar and result:
                     result = result[0]
-            if session_flag and tp_flag:
+            if session_flag and tp_flag and not record_cls:
                 # 通过expunge使实例可以脱离session访问
                 session.expunge_all()
             return result
@@ -83,7 +204,7 @@ def execute_sql(sql, *, many: bool = False, scalar: bool = True, params=None, se
                 else:
                     return '', True
             else:
-                sql = sql.compile(compile_kwargs={'literal_binds': True}).string
+                sql = compile_olap(sql)
                 if params:
                     sql = sql.split('VALUES')[0] + 'VALUES'
                     session.execute(sql, params=params)
@@ -98,18 +219,42 @@ def execute_sql(sql, *, many: bool = False, scalar: bool = True, params=None, se
                 return result.rowcount, True
             else:
                 return 'SQL执行失败', False
+    except OperationalError as ex:
+        cancelled = (task := getattr(_query_local, 'task', None)) is not None and task.cancelled
+        if session_flag and sql.is_select and session.bind is not OLTPEngine and not cancelled:
+            # 只读副本查询失败（不是被取消的）：标记副本异常并回退到主库重试
+            session.rollback()
+            OLTPRouter.mark_failed(session.bind, ex)
+            with Session(OLTPEngine) as primary:
+                result = execute_sql(
+                    statement, many=many, scalar=scalar, record=record, session=primary, raise_error=raise_error
+                )
+                primary.expunge_all()
+                return result
+        if tp_flag:
+            session.rollback()
+        if raise_error:
+            raise
+        logger.exception(ex)
+        return str(ex), False
     except IntegrityError as ex:
         if tp_flag:
             session.rollback()
+        if raise_error:
+            raise
         logger.exception(ex)
         return ex.args[0], False
     except Exception as exx:
         if tp_flag:
             session.rollback()
+        if raise_error:
+            raise
         logger.exception(exx)
         return str(exx), False
     finally:
         if session_flag:
+            if task := getattr(_query_local, 'task', None):
+                task.unbind()
             if tp_flag:
                 session.commit()
                 session.close()
@@ -141,6 +286,49 @@ def exceptions(default=None):
     return decorator
 
 
+def execute_concurrently(queries: list, timeout: float = QUERY_CONCURRENT_TIMEOUT) -> list:
+    """
+    并发执行多个互不依赖的查询，每个查询使用各自的连接（OLTP优先走只读副本，OLAP各自创建客户端）
+    任意一个查询失败或超时都会取消其他未完成的查询并抛出异常
+    Args:
+        queries: 查询列表，每一项是SQL对象，或者(SQL对象, execute_sql的参数)，参数中可以用timeout指定该查询的超时时间，
+            指定session时每个查询必须使用不同的session（OLTP的Session不能跨线程使用，只能传递OLAP客户端）
+        timeout: 单个查询的默认超时时间（秒）
+
+    Returns:
+        与queries顺序一致的查询结果
+    """
+    tasks = []
+    for query in queries:
+        sql, options = query if isinstance(query, tuple) else (query, {})
+        options = dict(options)
+        tasks.append(_QueryTask(sql, options, options.pop('timeout', timeout)))
+    if len(tasks) < 2 or QUERY_CONCURRENT_WORKERS <= 0:
+        return [task.run() for task in tasks]
+    # 复制上下文使读写一致等设置在查询线程中同样生效
+    futures = {_QueryExecutor.submit(contextvars.copy_context().run, task.run): task for task in tasks}
+    started = monotonic()
+    pending = set(futures)
+    error = None
+    while pending and error is None:
+        remain = min(futures[future].timeout for future in pending) - (monotonic() - started)
+        if remain <= 0:
+            error = TimeoutError('查询超时')
+            break
+        done, pending = wait(pending, timeout=remain, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                break
+    if error is not None:
+        for future, task in futures.items():
+            if not future.done():
+                future.cancel()
+                task.cancel()
+        raise error
+    return [future.result() for future in futures]
+
+
 def generate_key(source: str = None):
     """
     根据特定的输入输出id
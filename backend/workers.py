@@ -0,0 +1,16 @@
+"""
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+File Name   : workers.py
+Author      : jinming.yang
+Description : Kafka消息的处理函数定义，通过`python command.py kafka`启动消费
+处理函数通过KafkaWorker.handler注册，接收json.loads后的消息列表，例如：
+
+    @KafkaWorker.handler(Constants.TOPIC_XXX)
+    def handle_xxx(messages: list):
+        ...
+
+处理函数抛出异常时该批次不会提交offset，会重新消费，因此处理逻辑需要保证幂等
+- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+"""
+from utils import Constants
+from utils import KafkaWorker
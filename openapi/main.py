@@ -13,9 +13,8 @@ from sqlalchemy.orm import Relationship
 
 from apis.common import ParamDefine
 from apis.common import ParamSchema
-from backend.start import create_app
 from defines import *
-from schemas import *
+from openapi.schemas import *
 
 # 忽略的请求类型
 _MISSED_METHOD = {'OPTIONS', 'HEAD'}
@@ -23,19 +22,20 @@ _MISSED_METHOD = {'OPTIONS', 'HEAD'}
 _PARAMS_METHOD = {'GET', 'DELETE'}
 
 
-def get_apispec(data, info: OpenApiInfo) -> OpenApiDefine:
+def get_apispec(data, info: OpenApiInfo, blueprint: str = None) -> OpenApiDefine:
     """
     生成OpenAPI定义类
     Args:
         data: 序列化方法接收的原始数据
         info: 文档信息
+        blueprint: 只生成指定蓝图的接口，默认全部
 
     Returns:
         OpenApiDefine
     """
     # 根据数据的不同选择不同的处理方式
     function = _from_app
-    return function(data, info)
+    return function(data, info, blueprint)
 
 
 def _model_ref(name):
@@ -50,12 +50,13 @@ def _model_ref(name):
     return f'#/components/schemas/{name}'
 
 
-def _from_app(app, info):
+def _from_app(app, info, blueprint=None):
     """
     根据Flask应用生成OpenAPI
     Args:
         app: Flask应用
         info: OpenApiInfo
+        blueprint: 蓝图名称
 
     Returns:
         OpenApiDefine
@@ -198,7 +199,7 @@ def _from_app(app, info):
     # ***从这开始from_app的代码***
     apispec = OpenApiDefine(info, paths={})
     # 1.根据蓝图定义指定tags
-    apispec.tags = [OpenApiTag(bp.name) for bp in app.blueprints.values()]
+    apispec.tags = [OpenApiTag(bp.name) for bp in app.blueprints.values() if blueprint in (None, bp.name)]
     # 2. 根据model定义生成schema定义
     schemas = {}
     # 2.1 这里把OLAP、OLTP的定义都进行了导出，按需调整
@@ -223,13 +224,17 @@ def _from_app(app, info):
     endpoint_dict = {e: f for e, f in app.view_functions.items() if getattr(f, '__apispec__', None)}
     for rule in app.url_map.iter_rules():
         if rule.endpoint in endpoint_dict:
+            tag = rule.endpoint.split('.')[0]
+            if blueprint and tag != blueprint:
+                continue
             path = apispec.paths.setdefault(_parser_path(rule.rule), OpenApiPathItem())
             method = list(rule.methods - _MISSED_METHOD)[0]
-            tag = rule.endpoint.split('.')[0]
             setattr(path, method.lower(), _parser_api(endpoint_dict[rule.endpoint]))
     return apispec
 
 
 if __name__ == '__main__':
+    from backend.start import create_app
+
     api = get_apispec(create_app(), OpenApiInfo('flaskcli', 'mvp'))
     doc = api.to_file('schema.json')
@@ -45,23 +45,25 @@ class ExtensionJSONEncoder(json.JSONEncoder):
     """
 
     def default(self, obj):
+        if isinstance(obj, BaseDefine):
+            return obj.fields()  # 只展开一层，子对象在编码到时再展开
         if isinstance(obj, Enum):
             return obj.value
         if isinstance(obj, datetime):
             return obj.astimezone(tz).isoformat(timespec='seconds')
-        if isinstance(obj, BaseDefine):
-            return obj.json()
         return json.JSONEncoder.default(self, obj)
 
 
 class OpenApiDefine(BaseDefine):
-    _serializable = {
-        'openapi', 'info', 'jsonSchemaDialect', 'servers', 'paths', 'components', 'security', 'tags', 'externalDocs',
-    }
+    __slots__ = (
+        'openapi', 'info', 'jsonSchemaDialect', 'servers', 'paths', 'webhooks', 'components', 'security', 'tags',
+        'externalDocs',
+    )
+    _defaults = {'openapi': '3.1.0', 'jsonSchemaDialect': '$schema'}
 
-    openapi: str = '3.1.0'
+    openapi: str
     info: OpenApiInfo
-    jsonSchemaDialect: Optional[str] = '$schema'
+    jsonSchemaDialect: Optional[str]
     servers: Optional[List[OpenApiServer]]
     paths: Optional[Dict[str, OpenApiPathItem]]
     webhooks: Optional[Dict[str, Union[OpenApiPathItem, OpenApiReference]]]
@@ -88,14 +90,26 @@ class OpenApiDefine(BaseDefine):
         self.info = info
         super().__init__(**kwargs)
 
+    def dumps(self, indent: int = None) -> str:
+        """
+        生成JSON字符串：编码过程中逐个展开对象，不预先构造完整的字典
+        Args:
+            indent: 缩进的空格数，默认为紧凑格式
+
+        Returns:
+            JSON字符串
+        """
+        separators = (',', ':') if indent is None else None
+        return json.dumps(self, indent=indent, separators=separators, cls=ExtensionJSONEncoder)
+
     def to_file(self, file_path: str):
         """
-        生成文件
+        生成文件（边编码边写入）
         Args:
             file_path: 文件路径
         """
         with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.json(), f, indent=4, cls=ExtensionJSONEncoder)
+            json.dump(self, f, indent=4, cls=ExtensionJSONEncoder)
 
 
 __all__ = [
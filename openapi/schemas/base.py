@@ -13,30 +13,59 @@ def serialize(obj):
         elif isinstance(obj, dict):
             return obj  # 如果已经是基础的字典机构了就不用再转换了
         elif isinstance(obj, BaseDefine):
-            result = {}
-            for name in obj._serializable:
-                if value := getattr(obj, name, None):
-                    if obj._translate and name in obj._translate:
-                        name = obj._translate[name]
-                    result[name] = serialize(value)
-            return result
+            return {name: serialize(value) for name, value in obj.fields().items()}
         else:
             return obj
 
 
 class BaseDefine:
-    _translate = None
-    _serializable = None
+    """
+    OpenAPI对象的基类
+    子类通过__slots__声明字段（可以自由添加字段的类在__slots__中包含'__dict__'），
+    每个实例只保存自己设置过的字段，序列化时只访问本类声明的字段
+    """
+    __slots__ = ()
+    _translate = None  # {属性名: 输出的字段名}
+    _defaults = None  # {属性名: 默认值}
+    _serializable = None  # 允许在初始化时设置的字段，None表示不限制（由__slots__生成）
+    _output = ()  # (属性名, 输出的字段名)，按声明顺序（由__slots__生成）
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        names = [name for name in cls.__dict__.get('__slots__', ()) if name != '__dict__']
+        translate = cls._translate or {}
+        cls._serializable = frozenset(names) if names else None
+        cls._output = tuple((name, translate.get(name, name)) for name in names)
 
     def __init__(self, **kwargs):
+        if self._serializable is None:
+            self.__dict__.update(kwargs)
+            return
+        if self._defaults:
+            for key, value in self._defaults.items():
+                setattr(self, key, value)
         for key, value in kwargs.items():
-            if key not in self._serializable:
-                if issubclass(type(self), OpenApiSpecExtension) and key.startswith('x-'):
-                    self._serializable.add(key)
-                else:
-                    raise KeyError(f'{key} is not in {self._serializable}')
+            if self._serializable is not None and key not in self._serializable:
+                if not (key.startswith('x-') and isinstance(self, OpenApiSpecExtension)):
+                    raise KeyError(f'{key} is not in {set(self._serializable)}')
             setattr(self, key, value)
 
+    def fields(self) -> dict:
+        """
+        当前实例设置过且不为空的字段
+        Returns:
+            {输出的字段名: 值}
+        """
+        if not self._output:
+            return {name: value for name, value in self.__dict__.items() if value}
+        result = {name: value for attr, name in self._output if (value := getattr(self, attr, None))}
+        if extra := getattr(self, '__dict__', None):
+            translate = self._translate
+            for name, value in extra.items():
+                if value:
+                    result[translate.get(name, name) if translate else name] = value
+        return result
+
     def json(self):
         return serialize(self)
 
@@ -45,8 +74,4 @@ class OpenApiSpecExtension:
     """
     The extensions properties are implemented as patterned fields that are always prefixed by "x-"
     """
-    _serializable = set()
-
-    def __setattr__(self, key, value):
-        self._serializable.add(key)
-        super().__setattr__(key, value)
+    __slots__ = ()
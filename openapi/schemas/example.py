@@ -5,7 +5,7 @@ from .base import BaseDefine
 
 
 class OpenApiExample(BaseDefine):
-    _serializable = {'summary', 'description', 'value', 'externalValue'}
+    __slots__ = ('summary', 'description', 'value', 'externalValue')
 
     summary: Optional[str]
     description: Optional[str]
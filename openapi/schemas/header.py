@@ -11,18 +11,19 @@ from .schema import OpenApiSchema
 
 
 class OpenApiHeader(BaseDefine):
-    _serializable = {
-        'description', 'required', 'deprecated', 'allowEmptyValue', 'style',
-        'explode', 'allowReserved', 'schema', 'example', 'examples', 'content'
-    }
+    __slots__ = (
+        'description', 'required', 'deprecated', 'allowEmptyValue', 'style', 'explode', 'allowReserved', 'schema',
+        'example', 'examples', 'content',
+    )
+    _defaults = {'required': False, 'deprecated': False, 'allowReserved': False}
 
     description: Optional[str]
-    required: Optional[bool] = False
-    deprecated: Optional[bool] = False
+    required: Optional[bool]
+    deprecated: Optional[bool]
     allowEmptyValue: Optional[bool]
     style: Optional[str]
     explode: Optional[bool]
-    allowReserved: Optional[bool] = False
+    allowReserved: Optional[bool]
     schema: Optional[OpenApiSchema]
     example: Optional[Any]
     examples: Optional[Dict[str, Union[OpenApiExample, OpenApiReference]]]
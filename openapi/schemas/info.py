@@ -4,7 +4,7 @@ from .base import BaseDefine
 
 
 class OpenApiContact(BaseDefine):
-    _serializable = {'name', 'url', 'email'}
+    __slots__ = ('name', 'url', 'email')
 
     name: Optional[str]
     url: Optional[str]
@@ -23,7 +23,7 @@ class OpenApiContact(BaseDefine):
 
 
 class OpenApiLicense(BaseDefine):
-    _serializable = {'name', 'identifier', 'url'}
+    __slots__ = ('name', 'identifier', 'url')
 
     name: str
     identifier: Optional[str]
@@ -43,7 +43,7 @@ class OpenApiLicense(BaseDefine):
 
 
 class OpenApiInfo(BaseDefine):
-    _serializable = {'title', 'version', 'summary', 'description', 'termsOfService', 'contact', 'license'}
+    __slots__ = ('title', 'version', 'summary', 'description', 'termsOfService', 'contact', 'license')
 
     title: str
     version: str
@@ -6,11 +6,12 @@ from .schema import OpenApiMediaType
 
 
 class OpenApiRequestBody(BaseDefine):
-    _serializable = {'content', 'description', 'required'}
+    __slots__ = ('content', 'description', 'required')
+    _defaults = {'required': False}
 
     content: Dict[str, OpenApiMediaType]
     description: Optional[str]
-    required: Optional[bool] = False
+    required: Optional[bool]
 
     def __init__(self, content: Dict[str, OpenApiMediaType], **kwargs):
         """
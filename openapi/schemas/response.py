@@ -10,7 +10,7 @@ from .schema import OpenApiReference
 
 
 class OpenApiResponse(BaseDefine):
-    _serializable = {'description', 'headers', 'content', 'links'}
+    __slots__ = ('description', 'headers', 'content', 'links')
 
     description: str
     headers: Optional[Dict[str, Union[OpenApiHeader, OpenApiReference]]]
@@ -11,7 +11,7 @@ from .server import OpenApiServer
 
 
 class OpenApiSchema(BaseDefine):
-    _serializable = set()
+    __slots__ = ('__dict__',)
 
     def __init__(self, **kwargs):
         """
@@ -19,18 +19,12 @@ class OpenApiSchema(BaseDefine):
         Args:
             value: Any
         """
-        for key, value in kwargs.items():
-            self._serializable.add(key)
-            setattr(self, key, value)
-
-    def __setattr__(self, key, value):
-        self._serializable.add(key)
-        super().__setattr__(key, value)
+        super().__init__(**kwargs)
 
 
 class OpenApiReference(BaseDefine):
     _translate = {'ref': '$ref'}
-    _serializable = {'ref', }
+    __slots__ = ('ref', 'summary', 'description')
 
     ref: str
     summary: Optional[str]
@@ -50,7 +44,7 @@ class OpenApiReference(BaseDefine):
 
 
 class OpenApiEncoding(BaseDefine, OpenApiSpecExtension):
-    _serializable = {'contentType', 'headers', 'style', 'explode', 'allowReserved'}
+    __slots__ = ('contentType', 'headers', 'style', 'explode', 'allowReserved', '__dict__')
 
     contentType: Optional[str]
     headers: Any
@@ -73,7 +67,7 @@ class OpenApiEncoding(BaseDefine, OpenApiSpecExtension):
 
 
 class OpenApiMediaType(BaseDefine):
-    _serializable = {'schema', 'example', 'examples', 'encoding'}
+    __slots__ = ('schema', 'example', 'examples', 'encoding')
 
     schema: Optional[Union[OpenApiSchema, OpenApiReference]]
     example: Optional[Any]
@@ -95,20 +89,21 @@ class OpenApiMediaType(BaseDefine):
 
 class OpenApiParameter(BaseDefine):
     _translate = {'in_': 'in'}
-    _serializable = {
-        'name', 'in_', 'description', 'required', 'deprecated', 'allowEmptyValue', 'style',
-        'explode', 'allowReserved', 'schema', 'example', 'examples', 'content',
-    }
+    __slots__ = (
+        'name', 'in_', 'description', 'required', 'deprecated', 'allowEmptyValue', 'style', 'explode',
+        'allowReserved', 'schema', 'example', 'examples', 'content',
+    )
+    _defaults = {'required': False, 'deprecated': False, 'allowReserved': False}
 
     name: str
     in_: str
     description: Optional[str]
-    required: Optional[bool] = False
-    deprecated: Optional[bool] = False
+    required: Optional[bool]
+    deprecated: Optional[bool]
     allowEmptyValue: Optional[bool]
     style: Optional[str]
     explode: Optional[bool]
-    allowReserved: Optional[bool] = False
+    allowReserved: Optional[bool]
     schema: Optional[OpenApiSchema]
     example: Optional[Any]
     examples: Optional[Dict[str, Union[OpenApiExample, OpenApiReference]]]
@@ -151,10 +146,10 @@ class OpenApiParameter(BaseDefine):
 
 
 class OpenApiOperation(BaseDefine):
-    _serializable = {
-        'tags', 'summary', 'description', 'externalDocs', 'operationId', 'parameters',
-        'requestBody', 'responses', 'callbacks', 'deprecated', 'security', 'servers',
-    }
+    __slots__ = (
+        'tags', 'summary', 'description', 'externalDocs', 'operationId', 'parameters', 'requestBody', 'responses',
+        'callbacks', 'deprecated', 'security', 'servers',
+    )
 
     tags: Optional[List[str]]
     summary: Optional[str]
@@ -196,10 +191,10 @@ class OpenApiOperation(BaseDefine):
 
 class OpenApiPathItem(BaseDefine):
     _translate = {'ref': '$ref'}
-    _serializable = {
-        'ref', 'summary', 'description', 'get', 'put', 'post', 'delete',
-        'options', 'head', 'patch', 'trace', 'servers', 'parameters',
-    }
+    __slots__ = (
+        'ref', 'summary', 'description', 'get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace',
+        'servers', 'parameters',
+    )
 
     ref: Optional[str]
     summary: Optional[str]
@@ -238,6 +233,7 @@ class OpenApiPathItem(BaseDefine):
 
 
 class OpenApiCallback(BaseDefine, OpenApiSpecExtension):
+    __slots__ = ('__dict__',)
 
     def __init__(self, **kwargs):
         """
@@ -254,7 +250,7 @@ class OpenApiCallback(BaseDefine, OpenApiSpecExtension):
 
 
 class OpenApiDiscriminator(BaseDefine, OpenApiSpecExtension):
-    _serializable = {'propertyName', 'mapping'}
+    __slots__ = ('propertyName', 'mapping', '__dict__')
 
     propertyName: str
     mapping: Optional[Dict[str, str]]
@@ -272,7 +268,7 @@ class OpenApiDiscriminator(BaseDefine, OpenApiSpecExtension):
 
 
 class OpenApiExternalDoc(BaseDefine):
-    _serializable = {'url', 'description'}
+    __slots__ = ('url', 'description')
 
     url: str
     description: Optional[str]
@@ -290,7 +286,7 @@ class OpenApiExternalDoc(BaseDefine):
 
 
 class OpenApiTag(BaseDefine):
-    _serializable = {'name', 'description', 'externalDocs'}
+    __slots__ = ('name', 'description', 'externalDocs')
 
     name: str
     description: Optional[str]
@@ -310,7 +306,7 @@ class OpenApiTag(BaseDefine):
 
 
 class OpenApiLink(BaseDefine, OpenApiSpecExtension):
-    _serializable = {'operationRef', 'operationId', 'parameters', 'requestBody', 'description', 'server'}
+    __slots__ = ('operationRef', 'operationId', 'parameters', 'requestBody', 'description', 'server', '__dict__')
 
     operationRef: Optional[str]
     operationId: Optional[str]
@@ -335,10 +331,10 @@ class OpenApiLink(BaseDefine, OpenApiSpecExtension):
 
 
 class OpenApiComponent(BaseDefine, OpenApiSpecExtension):
-    _serializable = {
-        'schemas', 'responses', 'parameters', 'examples', 'requestBodies',
-        'headers', 'securitySchemes', 'links', 'callbacks', 'pathItems',
-    }
+    __slots__ = (
+        'schemas', 'parameters', 'examples', 'securitySchemes', 'requestBodies', 'responses', 'headers', 'links',
+        'callbacks', 'pathItems', '__dict__',
+    )
 
     schemas: Dict[str, OpenApiSchema]
     parameters: Dict[str, Union[OpenApiParameter, OpenApiReference]]
@@ -12,7 +12,7 @@ class OpenApiOAuthFlow(BaseDefine, OpenApiSpecExtension):
         'token_url': 'tokenUrl',
         'refresh_url': 'refreshUrl'
     }
-    _serializable = {'authorization_url', 'token_url', 'scopes', 'refresh_url'}
+    __slots__ = ('authorization_url', 'token_url', 'scopes', 'refresh_url', '__dict__')
 
     authorization_url: str
     token_url: str
@@ -30,7 +30,7 @@ class OpenApiOAuthFlow(BaseDefine, OpenApiSpecExtension):
                 refresh_url: str
         """
         self.authorization_url = authorization_url
-        self.tokenUrl = token_url
+        self.token_url = token_url
         self.scopes = scopes
         super().__init__(**kwargs)
 
@@ -40,7 +40,7 @@ class OpenApiOAuthFlows(BaseDefine):
         'client_credentials': 'clientCredentials',
         'authorization_code': 'authorizationCode',
     }
-    _serializable = {'implicit', 'password', 'client_credentials', 'authorization_code'}
+    __slots__ = ('implicit', 'password', 'client_credentials', 'authorization_code')
 
     implicit: Optional[OpenApiOAuthFlow]
     password: Optional[OpenApiOAuthFlow]
@@ -62,7 +62,9 @@ class OpenApiOAuthFlows(BaseDefine):
 
 class OpenApiSecurity(BaseDefine, OpenApiSpecExtension):
     _translate = {'type_': 'type', 'in_': 'in', 'open_id_connect_url': 'openIdConnectUrl'}
-    _serializable = ('type_', 'in_', 'name', 'scheme', 'description', 'bearerFormat', 'flows', 'open_id_connect_url')
+    __slots__ = (
+        'type_', 'in_', 'name', 'scheme', 'open_id_connect_url', 'flows', 'description', 'bearerFormat', '__dict__',
+    )
 
     type_: str
     in_: str
@@ -97,7 +99,7 @@ class OpenApiSecurity(BaseDefine, OpenApiSpecExtension):
 
 
 class OpenApiSecurityRequirement(BaseDefine):
-    _serializable = set()
+    __slots__ = ('__dict__',)
 
     def __init__(self, **kwargs):
         """
@@ -110,7 +112,3 @@ class OpenApiSecurityRequirement(BaseDefine):
             if type(value) != List[str]:
                 raise TypeError(f"{key} must be a list")
             setattr(self, key, value)
-
-    def __setattr__(self, key, value):
-        self._serializable.add(key)
-        super().__setattr__(key, value)
@@ -6,7 +6,7 @@ from .base import BaseDefine
 
 
 class OpenApiServerVariable(BaseDefine):
-    _serializable = {'enum', 'default', 'description'}
+    __slots__ = ('default', 'enum', 'description')
 
     default: str
     enum: Optional[List[str]]
@@ -26,7 +26,7 @@ class OpenApiServerVariable(BaseDefine):
 
 
 class OpenApiServer(BaseDefine):
-    _serializable = {'url', 'description', 'variables'}
+    __slots__ = ('url', 'description', 'variables')
 
     url: str
     description: Optional[str]